@@ -0,0 +1,169 @@
+"""
+Incremental multi-metric anomaly detection
+
+Each city keeps a sliding window of daily values for several metrics with
+Welford-style running mean/variance, updated in O(1) per metric as days
+arrive. Optional seasonal baselines accumulate per-month statistics over every
+day ever observed. Detection compares the whole window against the baseline
+with one vectorized pass.
+"""
+import threading
+from bisect import insort
+
+import numpy as np
+
+METRICS = ('temperature', 'AQI', 'PM2.5', 'humidity', 'rainfall')
+
+
+class RunningStats:
+    """Vectorized Welford accumulators, one per metric; NaN values are skipped"""
+
+    def __init__(self, size):
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def add(self, values):
+        present = ~np.isnan(values)
+        self.count[present] += 1
+        delta = np.where(present, values - self.mean, 0.0)
+        self.mean += np.divide(delta, self.count, out=np.zeros_like(delta), where=present)
+        self.m2 += np.where(present, delta * (values - self.mean), 0.0)
+
+    def remove(self, values):
+        present = ~np.isnan(values)
+        last = present & (self.count <= 1)
+        remaining = present & ~last
+        self.count[present] -= 1
+        delta = np.where(remaining, values - self.mean, 0.0)
+        self.mean -= np.divide(delta, self.count, out=np.zeros_like(delta), where=remaining)
+        self.m2 -= np.where(remaining, delta * (values - self.mean), 0.0)
+        # Removing the only value resets the accumulator
+        self.mean[last] = 0.0
+        self.m2[last] = 0.0
+        np.maximum(self.m2, 0.0, out=self.m2)
+
+    def std(self):
+        """Population standard deviation (NaN where there is no data)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(np.where(self.count > 0, self.m2 / self.count, np.nan))
+
+
+class AnomalyTracker:
+    """Rolling statistics over the last `window` days of one city"""
+
+    def __init__(self, window=30, metrics=METRICS):
+        self.window = window
+        self.metrics = tuple(metrics)
+        self.days = {}  # date -> metric vector, at most `window` most recent dates
+        self.order = []  # dates in self.days, oldest first
+        self.stats = RunningStats(len(self.metrics))
+        self.seasonal = {}  # 'MM' -> RunningStats over every day ever observed
+        self.seasonal_days = {}  # date -> vector counted in the seasonal baseline
+        self._lock = threading.Lock()
+
+    def vector(self, record):
+        return np.array([_as_float(record.get(metric)) for metric in self.metrics])
+
+    def observe(self, records):
+        """Add or update daily records. Newer days are O(1); out-of-order or changed days rebuild the window."""
+        with self._lock:
+            rebuild = False
+            for record in sorted(records, key=lambda r: r['date']):
+                date = record['date']
+                values = self.vector(record)
+                counted = self.seasonal_days.get(date)
+                if counted is None or not np.array_equal(counted, values, equal_nan=True):
+                    baseline = self.seasonal.setdefault(date[5:7], RunningStats(len(self.metrics)))
+                    if counted is not None:
+                        # A partial day (today, yesterday) was refreshed: swap its old values out
+                        baseline.remove(counted)
+                    baseline.add(values)
+                    self.seasonal_days[date] = values
+
+                if date in self.days:
+                    if not np.array_equal(self.days[date], values, equal_nan=True):
+                        self.days[date] = values
+                        rebuild = True
+                elif not self.order or date > self.order[-1]:
+                    # The common case: the next day in sequence slides the window forward
+                    self.days[date] = values
+                    self.order.append(date)
+                    if not rebuild:
+                        self.stats.add(values)
+                    if len(self.order) > self.window:
+                        removed = self.days.pop(self.order.pop(0))
+                        if not rebuild:
+                            self.stats.remove(removed)
+                elif len(self.order) < self.window or date > self.order[0]:
+                    # A backfilled day inside the window
+                    self.days[date] = values
+                    insort(self.order, date)
+                    if len(self.order) > self.window:
+                        del self.days[self.order.pop(0)]
+                    rebuild = True
+            if rebuild:
+                self.stats = RunningStats(len(self.metrics))
+                for date in self.order:
+                    self.stats.add(self.days[date])
+
+    def dates(self):
+        with self._lock:
+            return set(self.days)
+
+    def detect(self, z_threshold=2.0, metrics=None, seasonal=False, min_seasonal_days=10):
+        """Anomalies in the current window: |value - mean| > z_threshold * std.
+
+        With seasonal=True each day is compared against its calendar month's
+        baseline when that month has at least min_seasonal_days observations,
+        falling back to the rolling window otherwise.
+        """
+        metrics = [metric for metric in (metrics or self.metrics) if metric in self.metrics]
+        with self._lock:
+            if not self.days:
+                return []
+            dates = list(self.order)
+            values = np.vstack([self.days[date] for date in dates])
+            means = np.tile(self.stats.mean, (len(dates), 1))
+            stds = np.tile(self.stats.std(), (len(dates), 1))
+            if seasonal:
+                for row, date in enumerate(dates):
+                    baseline = self.seasonal.get(date[5:7])
+                    if baseline is not None:
+                        usable = baseline.count >= min_seasonal_days
+                        means[row, usable] = baseline.mean[usable]
+                        stds[row, usable] = baseline.std()[usable]
+            counts = self.stats.count.copy()
+
+        columns = [self.metrics.index(metric) for metric in metrics]
+        values, means, stds = values[:, columns], means[:, columns], stds[:, columns]
+        deviation = np.abs(values - means)
+        with np.errstate(invalid='ignore'):
+            flagged = deviation > z_threshold * stds
+        # Mirror the original rule of needing at least 5 days before flagging anything
+        flagged &= (counts[columns] >= 5)[np.newaxis, :]
+        flagged &= ~np.isnan(values)
+
+        anomalies = []
+        for row, col in zip(*np.nonzero(flagged)):
+            metric = metrics[col]
+            value = float(values[row, col])
+            std = float(stds[row, col])
+            anomalies.append({
+                'date': dates[row],
+                'metric': metric,
+                metric: value,
+                'value': value,
+                'mean': float(means[row, col]),
+                'deviation': float(deviation[row, col]),
+                'z_score': float(deviation[row, col] / std) if std > 0 else None,
+            })
+        anomalies.sort(key=lambda anomaly: (anomaly['date'], metrics.index(anomaly['metric'])))
+        return anomalies
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
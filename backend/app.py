@@ -1,16 +1,47 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-import requests
 import cohere
 import datetime
+import logging
+import queue
+import requests
+import time
 
+from concurrent.futures import TimeoutError as FuturesTimeoutError, as_completed
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
 
+import aqi
+from anomaly import METRICS as ANOMALY_METRICS, AnomalyTracker
+from cache import TTLCache
+from columnar import to_columnar, wants_columnar
+from compression import compress_response
+from deadline import (current_deadline, end_deadline, expired as deadline_expired, mark_incomplete, remaining,
+                      start_deadline)
+from logging_config import configure_logging
+from live import LiveHub
+from location_index import LocationIndex
+from locations import LocationResolver
+from prewarm import PrewarmScheduler
+from quota import (ContextExecutor, QuotaExceededError, QuotaScheduler, current_priority, prioritized,
+                   request_priority)
+from rollups import RESOLUTIONS, group_by_period, period_length, rollup_records
+from streaming import requested_stream_mode, stream_response
+from metrics import (APPROXIMATE_RESPONSES, COHERE_REQUEST_DURATION, HTTP_REQUEST_DURATION, HTTP_REQUEST_ERRORS,
+                     REGISTRY)
+from history_store import HistoryStore
+from json_provider import FastJSONProvider
+from http_cache import CachePolicy, ConditionalResponder
+from summary_cache import SummaryCache
+from upstream import CircuitBreaker, UpstreamClient
+
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # CORS configuration - Allow both local development and production URLs
 allowed_origins = [
@@ -29,117 +60,185 @@ if FRONTEND_URL and FRONTEND_URL not in allowed_origins:
 # Configure CORS with all necessary headers
 CORS(app, 
      resources={r"/api/*": {"origins": allowed_origins}},
-     allow_headers=["Content-Type", "Authorization"],
+     allow_headers=["Content-Type", "Authorization", "X-Timeout-Ms"],
+     expose_headers=["X-Complete", "X-Incomplete"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      supports_credentials=True)
 
 """
 Weather and Cohere API configuration
 You need to set your API keys as environment variables: WEATHER_API_KEY, COHERE_API_KEY
+WEATHER_API_BASE_URL and COHERE_BASE_URL point the app at another server, e.g. bench/mock_upstream.py
 """
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-print("COHERE_API_KEY loaded:", bool(COHERE_API_KEY))
+COHERE_BASE_URL = os.getenv("COHERE_BASE_URL")
+logger.info("COHERE_API_KEY loaded: %s", bool(COHERE_API_KEY))
 cohere_client = None
 if COHERE_API_KEY:
-    cohere_client = cohere.Client(COHERE_API_KEY)
+    cohere_client = cohere.Client(COHERE_API_KEY, base_url=COHERE_BASE_URL) if COHERE_BASE_URL else cohere.Client(COHERE_API_KEY)
+
+# Generated summaries are reused for similar conditions and refreshed in the background once stale
+summary_cache = SummaryCache(
+    fresh_ttl=int(os.getenv("SUMMARY_FRESH_TTL", 1800)),
+    max_stale=int(os.getenv("SUMMARY_MAX_STALE", 21600)),
+    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 1024))
+)
 
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
-print("WEATHER_API_KEY loaded:", bool(WEATHER_API_KEY))
+logger.info("WEATHER_API_KEY loaded: %s", bool(WEATHER_API_KEY))
 if not WEATHER_API_KEY:
-    print("WARNING: WEATHER_API_KEY not found in environment variables. Weather functionality may not work.")
-WEATHER_API_BASE_URL = "http://api.weatherapi.com/v1"
+    logger.warning("WEATHER_API_KEY not found in environment variables. Weather functionality may not work.")
+WEATHER_API_BASE_URL = os.getenv("WEATHER_API_BASE_URL", "http://api.weatherapi.com/v1")
+
+"""
+Upstream budgets
+Every WeatherAPI and Cohere call spends a token from its provider's bucket.
+Interactive requests go first; /api/batch and live polling run as batch,
+pre-warming as prefetch, and history days older than QUOTA_BACKFILL_AFTER_DAYS
+fetched by background work as backfill, which is shed first when the budget runs low.
+"""
+weather_api_budget = QuotaScheduler(
+    "weatherapi",
+    rate=float(os.getenv("WEATHER_API_RATE_LIMIT", 10)),
+    burst=int(os.getenv("WEATHER_API_BURST", 20)),
+    monthly_quota=int(os.getenv("WEATHER_API_MONTHLY_QUOTA", 0))
+)
+cohere_budget = QuotaScheduler(
+    "cohere",
+    rate=float(os.getenv("COHERE_RATE_LIMIT", 1)),
+    burst=int(os.getenv("COHERE_BURST", 5)),
+    monthly_quota=int(os.getenv("COHERE_MONTHLY_QUOTA", 0))
+)
+QUOTA_BACKFILL_AFTER_DAYS = int(os.getenv("QUOTA_BACKFILL_AFTER_DAYS", 30))
+
+# Shared pooled client for every WeatherAPI call: timeouts, retries with backoff, circuit breaker
+weather_api = UpstreamClient(
+    "weatherapi",
+    WEATHER_API_BASE_URL,
+    default_params={'key': WEATHER_API_KEY},
+    connect_timeout=float(os.getenv("WEATHER_API_CONNECT_TIMEOUT", 3.05)),
+    read_timeout=float(os.getenv("WEATHER_API_READ_TIMEOUT", 10)),
+    max_retries=int(os.getenv("WEATHER_API_MAX_RETRIES", 2)),
+    pool_size=int(os.getenv("WEATHER_API_POOL_SIZE", 32)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("WEATHER_API_BREAKER_THRESHOLD", 5)),
+        reset_timeout=float(os.getenv("WEATHER_API_BREAKER_RESET", 30))
+    ),
+    scheduler=weather_api_budget
+)
+
+# Maximum number of history.json requests in flight for a single history fetch
+HISTORY_FETCH_CONCURRENCY = int(os.getenv("HISTORY_FETCH_CONCURRENCY", 8))
+
+# Fetch consecutive missing days with one dt..end_dt call: 'auto' tries ranges and
+# falls back to per-day calls once the plan turns out not to support them, trying
+# ranges again every HISTORY_RANGE_RECHECK_INTERVAL seconds
+HISTORY_RANGE_MODE = os.getenv("HISTORY_RANGE_MODE", "auto").lower()
+HISTORY_RANGE_MAX_DAYS = int(os.getenv("HISTORY_RANGE_MAX_DAYS", 30))
+HISTORY_RANGE_RECHECK_INTERVAL = int(os.getenv("HISTORY_RANGE_RECHECK_INTERVAL", 3600))
+history_range_supported = None  # None until the first multi-day range call answers
+history_range_checked_at = 0.0
+# WeatherAPI error codes about the key, quota or location (e.g. 1006, no matching
+# location), which say nothing about whether date ranges are supported
+WEATHERAPI_REQUEST_ERRORS = {1002, 1003, 1005, 1006, 2006, 2007, 2008}
+
+# Worker pool and size limit for /api/batch; default days per batch kind
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", 8))
+BATCH_MAX_CITIES = int(os.getenv("BATCH_MAX_CITIES", 50))
+BATCH_DEFAULT_DAYS = {'current': 0, 'forecast': 3, 'history': 7}
+
+"""
+Request deadlines
+Every request gets a time budget that each upstream call, retry and wait is
+clamped to: the client's X-Timeout-Ms header (or ?timeout_ms=) up to
+REQUEST_DEADLINE_MAX, else the view's entry in ROUTE_DEADLINES, else
+REQUEST_DEADLINE_DEFAULT (seconds, 0 for none). When it runs out the response
+carries what has arrived, with X-Complete: false and X-Incomplete naming the
+missing parts. Streams send days as they arrive and have no deadline.
+"""
+REQUEST_DEADLINE_DEFAULT = float(os.getenv("REQUEST_DEADLINE_DEFAULT", 10))
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", 30))
+# View -> seconds; ROUTE_DEADLINES="get_summary=5,get_batch=20" overrides entries
+ROUTE_DEADLINES = {'get_summary': 8.0, 'get_anomalies': 15.0, 'get_batch': 20.0}
+for entry in os.getenv("ROUTE_DEADLINES", "").split(","):
+    if "=" in entry:
+        view, seconds = entry.split("=", 1)
+        ROUTE_DEADLINES[view.strip()] = float(seconds)
+
+"""
+Response caching
+Completed history days never change and are kept until LRU-evicted; today's
+history, current conditions and forecasts expire after their TTL (seconds).
+"""
+CACHE_CURRENT_TTL = int(os.getenv("CACHE_CURRENT_TTL", 60))
+CACHE_TODAY_TTL = int(os.getenv("CACHE_TODAY_TTL", 600))
+CACHE_FORECAST_TTL = int(os.getenv("CACHE_FORECAST_TTL", 1800))
+current_cache = TTLCache("current", max_entries=int(os.getenv("CACHE_CURRENT_MAX_ENTRIES", 512)))
+history_cache = TTLCache("history", max_entries=int(os.getenv("CACHE_HISTORY_MAX_ENTRIES", 10000)))
+forecast_cache = TTLCache("forecast", max_entries=int(os.getenv("CACHE_FORECAST_MAX_ENTRIES", 512)))
+
+"""
+Anomaly detection
+Rolling per-city statistics over the last ANOMALY_WINDOW days; only days the
+tracker has not seen yet (plus the still-changing recent days) are fetched per query.
+"""
+ANOMALY_WINDOW = int(os.getenv("ANOMALY_WINDOW", 30))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", 2.0))
+ANOMALY_MAX_WINDOW = int(os.getenv("ANOMALY_MAX_WINDOW", 365))
+anomaly_trackers = TTLCache("anomaly", max_entries=int(os.getenv("ANOMALY_MAX_CITIES", 1000)))
+
+"""
+Persistent history store
+Completed history days are kept on disk so restarts and other workers reuse them.
+Set HISTORY_STORE_PATH to an empty value to disable the store.
+"""
+HISTORY_STORE_PATH = os.getenv("HISTORY_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history.db"))
+history_store = None
+if HISTORY_STORE_PATH:
+    try:
+        history_store = HistoryStore(
+            HISTORY_STORE_PATH,
+            retention_days=int(os.getenv("HISTORY_RETENTION_DAYS", 400)),
+            max_rows=int(os.getenv("HISTORY_STORE_MAX_ROWS", 500000)),
+            max_aliases=int(os.getenv("LOCATION_ALIASES_MAX_ENTRIES", 50000)),
+            rollup_retention_days=int(os.getenv("HISTORY_ROLLUP_RETENTION_DAYS", 1825)),
+            max_rollups=int(os.getenv("HISTORY_ROLLUP_MAX_ROWS", 100000))
+        )
+    except Exception as e:
+        logger.warning("History store disabled, could not open %s: %s", HISTORY_STORE_PATH, e)
+
+# Aliases of a place ('london', 'London, UK', '51.52,-0.11') share one canonical key once a response resolves them;
+# learned aliases are kept in the history store so restarts and other workers use the same keys
+# A "lat,lon" query within GEO_MATCH_RADIUS_KM of a place with fresh cached current/forecast data is
+# answered from that entry, flagged approximate (0 disables)
+GEO_MATCH_RADIUS_KM = float(os.getenv("GEO_MATCH_RADIUS_KM", 1.0))
+location_resolver = LocationResolver(max_entries=int(os.getenv("LOCATION_ALIASES_MAX_ENTRIES", 50000)),
+                                     grid_cell_km=max(GEO_MATCH_RADIUS_KM, 0.1),
+                                     store=history_store)
 
 def calculate_aqi_from_pm25(pm25):
     """Calculate AQI from PM2.5 concentration using EPA standards"""
-    if pm25 <= 12.0:
-        return int(((50 - 0) / (12.0 - 0)) * (pm25 - 0) + 0)
-    elif pm25 <= 35.4:
-        return int(((100 - 51) / (35.4 - 12.1)) * (pm25 - 12.1) + 51)
-    elif pm25 <= 55.4:
-        return int(((150 - 101) / (55.4 - 35.5)) * (pm25 - 35.5) + 101)
-    elif pm25 <= 150.4:
-        return int(((200 - 151) / (150.4 - 55.5)) * (pm25 - 55.5) + 151)
-    elif pm25 <= 250.4:
-        return int(((300 - 201) / (250.4 - 150.5)) * (pm25 - 150.5) + 201)
-    elif pm25 <= 350.4:
-        return int(((400 - 301) / (350.4 - 250.5)) * (pm25 - 250.5) + 301)
-    else:
-        return int(((500 - 401) / (500.4 - 350.5)) * (pm25 - 350.5) + 401)
+    return aqi.sub_index('pm2_5', pm25)
 
 def calculate_aqi_from_pm10(pm10):
     """Calculate AQI from PM10 concentration using EPA standards"""
-    if pm10 <= 54:
-        return int(((50 - 0) / (54 - 0)) * (pm10 - 0) + 0)
-    elif pm10 <= 154:
-        return int(((100 - 51) / (154 - 55)) * (pm10 - 55) + 51)
-    elif pm10 <= 254:
-        return int(((150 - 101) / (254 - 155)) * (pm10 - 155) + 101)
-    elif pm10 <= 354:
-        return int(((200 - 151) / (354 - 255)) * (pm10 - 255) + 151)
-    elif pm10 <= 424:
-        return int(((300 - 201) / (424 - 355)) * (pm10 - 355) + 201)
-    else:
-        return int(((500 - 301) / (604 - 425)) * (pm10 - 425) + 301)
+    return aqi.sub_index('pm10', pm10)
 
 def calculate_aqi_from_no2(no2):
     """Calculate AQI from NO2 concentration (ppb)"""
-    if no2 <= 53:
-        return int(((50 - 0) / (53 - 0)) * (no2 - 0) + 0)
-    elif no2 <= 100:
-        return int(((100 - 51) / (100 - 54)) * (no2 - 54) + 51)
-    elif no2 <= 360:
-        return int(((150 - 101) / (360 - 101)) * (no2 - 101) + 101)
-    elif no2 <= 649:
-        return int(((200 - 151) / (649 - 361)) * (no2 - 361) + 151)
-    elif no2 <= 1249:
-        return int(((300 - 201) / (1249 - 650)) * (no2 - 650) + 201)
-    else:
-        return int(((500 - 301) / (2049 - 1250)) * (no2 - 1250) + 301)
+    return aqi.sub_index('no2', no2)
 
 def calculate_aqi_from_so2(so2):
     """Calculate AQI from SO2 concentration (ppb)"""
-    if so2 <= 35:
-        return int(((50 - 0) / (35 - 0)) * (so2 - 0) + 0)
-    elif so2 <= 75:
-        return int(((100 - 51) / (75 - 36)) * (so2 - 36) + 51)
-    elif so2 <= 185:
-        return int(((150 - 101) / (185 - 76)) * (so2 - 76) + 101)
-    elif so2 <= 304:
-        return int(((200 - 151) / (304 - 186)) * (so2 - 186) + 151)
-    elif so2 <= 604:
-        return int(((300 - 201) / (604 - 305)) * (so2 - 305) + 201)
-    else:
-        return int(((500 - 301) / (1004 - 605)) * (so2 - 605) + 301)
+    return aqi.sub_index('so2', so2)
 
 def calculate_aqi_from_co(co):
     """Calculate AQI from CO concentration (ppm)"""
-    if co <= 4.4:
-        return int(((50 - 0) / (4.4 - 0)) * (co - 0) + 0)
-    elif co <= 9.4:
-        return int(((100 - 51) / (9.4 - 4.5)) * (co - 4.5) + 51)
-    elif co <= 12.4:
-        return int(((150 - 101) / (12.4 - 9.5)) * (co - 9.5) + 101)
-    elif co <= 15.4:
-        return int(((200 - 151) / (15.4 - 12.5)) * (co - 12.5) + 151)
-    elif co <= 30.4:
-        return int(((300 - 201) / (30.4 - 15.5)) * (co - 15.5) + 201)
-    else:
-        return int(((500 - 301) / (50.4 - 30.5)) * (co - 30.5) + 301)
+    return aqi.sub_index('co', co)
 
 def calculate_aqi_from_o3(o3):
     """Calculate AQI from O3 concentration (ppb)"""
-    if o3 <= 54:
-        return int(((50 - 0) / (54 - 0)) * (o3 - 0) + 0)
-    elif o3 <= 70:
-        return int(((100 - 51) / (70 - 55)) * (o3 - 55) + 51)
-    elif o3 <= 85:
-        return int(((150 - 101) / (85 - 71)) * (o3 - 71) + 101)
-    elif o3 <= 105:
-        return int(((200 - 151) / (105 - 86)) * (o3 - 86) + 151)
-    elif o3 <= 200:
-        return int(((300 - 201) / (200 - 106)) * (o3 - 106) + 201)
-    else:
-        return max(301, min(500, int(((500 - 301) / (300 - 201)) * (o3 - 201) + 301)))
+    return aqi.sub_index('o3', o3)
 
 def calculate_comprehensive_aqi(air_quality, city_name="Unknown"):
     """Calculate AQI from ALL available pollutants with proper unit conversion"""
@@ -156,10 +255,8 @@ def calculate_comprehensive_aqi(air_quality, city_name="Unknown"):
     co_ugm3 = air_quality.get('co', 0)
     o3_ugm3 = air_quality.get('o3', 0)
     
-    print(f"Raw pollutant values for {city_name}:")
-    print(f"PM2.5: {pm25} µg/m³, PM10: {pm10} µg/m³")
-    print(f"NO2: {no2_ugm3} µg/m³, SO2: {so2_ugm3} µg/m³")
-    print(f"CO: {co_ugm3} µg/m³, O3: {o3_ugm3} µg/m³")
+    logger.debug("Raw pollutant values for %s (µg/m³): PM2.5=%s PM10=%s NO2=%s SO2=%s CO=%s O3=%s",
+                 city_name, pm25, pm10, no2_ugm3, so2_ugm3, co_ugm3, o3_ugm3)
     
     # Calculate AQI from each available pollutant with unit conversion
     
@@ -167,46 +264,46 @@ def calculate_comprehensive_aqi(air_quality, city_name="Unknown"):
     if pm25 > 0:
         aqi_pm25 = calculate_aqi_from_pm25(pm25)
         aqi_values.append(aqi_pm25)
-        print(f"AQI from PM2.5 ({pm25} µg/m³): {aqi_pm25}")
+        logger.debug("AQI from PM2.5 (%s µg/m³): %s", pm25, aqi_pm25)
     
     # PM10 (µg/m³ - correct unit)
     if pm10 > 0:
         aqi_pm10 = calculate_aqi_from_pm10(pm10)
         aqi_values.append(aqi_pm10)
-        print(f"AQI from PM10 ({pm10} µg/m³): {aqi_pm10}")
+        logger.debug("AQI from PM10 (%s µg/m³): %s", pm10, aqi_pm10)
     
     # NO2 (convert from µg/m³ to ppb: µg/m³ * 0.532 = ppb)
     if no2_ugm3 > 0:
-        no2_ppb = no2_ugm3 * 0.532  # Conversion factor for NO2
+        no2_ppb = aqi.to_epa_units('no2', no2_ugm3)
         aqi_no2 = calculate_aqi_from_no2(no2_ppb)
         aqi_values.append(aqi_no2)
-        print(f"AQI from NO2 ({no2_ugm3} µg/m³ = {no2_ppb:.1f} ppb): {aqi_no2}")
+        logger.debug("AQI from NO2 (%s µg/m³ = %.1f ppb): %s", no2_ugm3, no2_ppb, aqi_no2)
     
     # SO2 (convert from µg/m³ to ppb: µg/m³ * 0.382 = ppb)
     if so2_ugm3 > 0:
-        so2_ppb = so2_ugm3 * 0.382  # Conversion factor for SO2
+        so2_ppb = aqi.to_epa_units('so2', so2_ugm3)
         aqi_so2 = calculate_aqi_from_so2(so2_ppb)
         aqi_values.append(aqi_so2)
-        print(f"AQI from SO2 ({so2_ugm3} µg/m³ = {so2_ppb:.1f} ppb): {aqi_so2}")
+        logger.debug("AQI from SO2 (%s µg/m³ = %.1f ppb): %s", so2_ugm3, so2_ppb, aqi_so2)
     
     # CO (convert from µg/m³ to ppm: µg/m³ * 0.000873 = ppm)
     if co_ugm3 > 0:
-        co_ppm = co_ugm3 * 0.000873  # Conversion factor for CO
+        co_ppm = aqi.to_epa_units('co', co_ugm3)
         aqi_co = calculate_aqi_from_co(co_ppm)
         aqi_values.append(aqi_co)
-        print(f"AQI from CO ({co_ugm3} µg/m³ = {co_ppm:.2f} ppm): {aqi_co}")
+        logger.debug("AQI from CO (%s µg/m³ = %.2f ppm): %s", co_ugm3, co_ppm, aqi_co)
     
     # O3 (convert from µg/m³ to ppb: µg/m³ * 0.510 = ppb)
     if o3_ugm3 > 0:
-        o3_ppb = o3_ugm3 * 0.510  # Conversion factor for O3
+        o3_ppb = aqi.to_epa_units('o3', o3_ugm3)
         aqi_o3 = calculate_aqi_from_o3(o3_ppb)
         aqi_values.append(aqi_o3)
-        print(f"AQI from O3 ({o3_ugm3} µg/m³ = {o3_ppb:.1f} ppb): {aqi_o3}")
+        logger.debug("AQI from O3 (%s µg/m³ = %.1f ppb): %s", o3_ugm3, o3_ppb, aqi_o3)
     
     # If we have calculated values, return the maximum (worst air quality)
     if aqi_values:
         final_aqi = max(aqi_values)
-        print(f"Final AQI (max of {aqi_values}): {final_aqi}")
+        logger.debug("Final AQI (max of %s): %s", aqi_values, final_aqi)
         return final_aqi
     
     # If no pollutant data available, estimate based on city characteristics
@@ -231,203 +328,545 @@ def calculate_comprehensive_aqi(air_quality, city_name="Unknown"):
         # Default for unknown cities
         estimated_aqi = 55 + (hash(city_name) % 30)   # 55-85 range
     
-    print(f"No pollutant data available for {city_name}, using city-based estimate: {estimated_aqi}")
+    logger.info("No pollutant data available for %s, using city-based estimate: %s", city_name, estimated_aqi)
     return max(25, min(200, estimated_aqi))  # Ensure reasonable range
 
 def calculate_aqi_from_pollutants(air_quality):
     """Legacy function for backward compatibility"""
     return calculate_comprehensive_aqi(air_quality)
 
+def location_key(city):
+    """Canonical location id (or normalized text, until resolved) used to key cached and stored data"""
+    return location_resolver.key(city)
+
+def cache_key(kind, city, *parts):
+    """Cache key for a WeatherAPI lookup: endpoint kind, location and extra parts (date, days)"""
+    return (kind, location_key(city)) + parts
+
+def get_cached(cache, kind, city, loader, *parts, ttl, nearby=False):
+    """cache.get_or_load on cache_key(kind, city, *parts).
+    
+    When the load is what resolved city to its canonical location, the value
+    is moved to the canonical key so other aliases find it. With nearby=True an
+    unresolved "lat,lon" query may be answered from a nearby place instead.
+    """
+    if nearby and location_resolver.resolve(city) is None:
+        value = get_nearby_cached(cache, kind, city, *parts)
+        if value is not None:
+            return value
+    key = cache_key(kind, city, *parts)
+    value = cache.get_or_load(key, loader, ttl=ttl)
+    canonical = cache_key(kind, city, *parts)
+    if value is not None and canonical != key:
+        cache.set(canonical, value, ttl=ttl)
+        cache.delete(key)
+    return value
+
+def get_nearby_cached(cache, kind, city, *parts):
+    """Fresh cached data of the nearest known place within GEO_MATCH_RADIUS_KM of a "lat,lon" query, or None"""
+    for distance_km, ident in location_resolver.nearby(city, GEO_MATCH_RADIUS_KM):
+        data = cache.get((kind, ident) + parts)
+        if data is not None:
+            APPROXIMATE_RESPONSES.inc(kind=kind)
+            return approximate(data, city, distance_km)
+    return None
+
+def approximate(data, query, distance_km):
+    """Copy of a cached record (or list of records) flagged as standing in for the queried coordinates"""
+    flags = {'approximate': True, 'requested_location': query, 'distance_km': round(distance_km, 3)}
+    if isinstance(data, list):
+        return [{**record, **flags} for record in data]
+    return {**data, **flags}
+
+def is_completed_day(date):
+    """Whether a history date can no longer change.
+    
+    Yesterday is still treated as in progress because the location's local day
+    may not have finished yet when the server clock has already rolled over.
+    """
+    cutoff = (datetime.datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    return date < cutoff
+
 def get_current_weather_and_aqi(city="London"):
     """Get current weather and air quality data for a city"""
     try:
-        url = f"{WEATHER_API_BASE_URL}/current.json"
-        params = {
-            'key': WEATHER_API_KEY,
-            'q': city,
-            'aqi': 'yes'  # Enable air quality data
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract relevant data
-        location = data['location']
-        current = data['current']
-        air_quality = current.get('air_quality', {})
-        
-        # DEBUG: Print raw air quality data
-        print(f"\n=== DEBUG: Raw air quality data for {location['name']} ===")
-        print(f"Full air_quality object: {air_quality}")
-        print(f"Available keys: {list(air_quality.keys()) if air_quality else 'No air quality data'}")
-        
-        # Calculate AQI with comprehensive fallback logic
-        api_aqi = air_quality.get('us-epa-index', 0)
-        print(f"API us-epa-index: {api_aqi}")
-        
-        if api_aqi and api_aqi > 10:  # Only trust API AQI if it's reasonable
-            calculated_aqi = api_aqi
-            print(f"Using API AQI for {location['name']}: {api_aqi}")
-        else:
-            # Calculate from ALL available pollutants
-            calculated_aqi = calculate_comprehensive_aqi(air_quality, location['name'])
-            print(f"Calculated comprehensive AQI for {location['name']}: {calculated_aqi}")
-        
-        print(f"=== END DEBUG ===\n")
-        
-        return {
-            'city': location['name'],
-            'country': location['country'],
-            'latitude': location['lat'],
-            'longitude': location['lon'],
-            'date': current['last_updated'],
-            'temperature': current['temp_c'],
-            'humidity': current['humidity'],
-            'rainfall': current.get('precip_mm', 0),
-            'condition': current['condition']['text'],
-            'wind_speed': current['wind_kph'],
-            'pressure': current['pressure_mb'],
-            'uv_index': current['uv'],
-            # Air Quality Data
-            'AQI': calculated_aqi,
-            'PM2.5': air_quality.get('pm2_5', 0),
-            'PM10': air_quality.get('pm10', 0),
-            'NO2': air_quality.get('no2', 0),
-            'SO2': air_quality.get('so2', 0),
-            'CO': air_quality.get('co', 0),
-            'O3': air_quality.get('o3', 0)
-        }
+        return get_cached(current_cache, 'current', city, lambda: fetch_current_weather_and_aqi(city),
+                          ttl=CACHE_CURRENT_TTL, nearby=True)
     except Exception as e:
-        print(f"Error fetching current weather: {e}")
+        logger.error("Error fetching current weather for %s: %s", city, e)
+        mark_incomplete('current')
         return None
 
-def get_historical_weather_and_aqi(city="London", days=7):
-    """Get historical weather and air quality data for specified days"""
+def fetch_current_weather_and_aqi(city):
+    """Fetch current weather and air quality data for a city from WeatherAPI"""
+    params = {
+        'q': location_resolver.upstream_query(city),
+        'aqi': 'yes'  # Enable air quality data
+    }
+    
+    data = weather_api.get_json("current.json", params)
+    
+    # Extract relevant data
+    location = data['location']
+    location_resolver.learn(city, location)
+    current = data['current']
+    air_quality = current.get('air_quality', {})
+    
+    logger.debug("Raw air quality data for %s: %s", location['name'], air_quality)
+    
+    # Calculate AQI with comprehensive fallback logic
+    api_aqi = air_quality.get('us-epa-index', 0)
+    
+    if api_aqi and api_aqi > 10:  # Only trust API AQI if it's reasonable
+        calculated_aqi = api_aqi
+        logger.debug("Using API AQI for %s: %s", location['name'], api_aqi)
+    else:
+        # Calculate from ALL available pollutants
+        calculated_aqi = calculate_comprehensive_aqi(air_quality, location['name'])
+        logger.debug("Calculated comprehensive AQI for %s: %s (API us-epa-index: %s)",
+                     location['name'], calculated_aqi, api_aqi)
+    
+    return {
+        'city': location['name'],
+        'country': location['country'],
+        'latitude': location['lat'],
+        'longitude': location['lon'],
+        'date': current['last_updated'],
+        'temperature': current['temp_c'],
+        'humidity': current['humidity'],
+        'rainfall': current.get('precip_mm', 0),
+        'condition': current['condition']['text'],
+        'wind_speed': current['wind_kph'],
+        'pressure': current['pressure_mb'],
+        'uv_index': current['uv'],
+        # Air Quality Data
+        'AQI': calculated_aqi,
+        'PM2.5': air_quality.get('pm2_5', 0),
+        'PM10': air_quality.get('pm10', 0),
+        'NO2': air_quality.get('no2', 0),
+        'SO2': air_quality.get('so2', 0),
+        'CO': air_quality.get('co', 0),
+        'O3': air_quality.get('o3', 0)
+    }
+
+def build_daily_record(location, date, day_data, pollutant_aqi=-1):
+    """Build a daily weather and air quality record from a WeatherAPI 'day' block
+    
+    pollutant_aqi: the day's AQI already scored from its pollutants (see
+    build_daily_records), or -1 to score it here.
+    """
+    air_quality = day_data.get('air_quality', {})
+    
+    # Calculate AQI with comprehensive fallback logic
+    api_aqi = air_quality.get('us-epa-index', 0)
+    if api_aqi and api_aqi > 10:  # Only trust API AQI if it's reasonable
+        calculated_aqi = api_aqi
+    elif pollutant_aqi >= 0:
+        calculated_aqi = pollutant_aqi
+    else:
+        # Calculate from ALL available pollutants
+        calculated_aqi = calculate_comprehensive_aqi(air_quality, location['name'])
+    
+    return {
+        'city': location['name'],
+        'country': location['country'],
+        'latitude': location['lat'],
+        'longitude': location['lon'],
+        'date': date,
+        'temperature': day_data['avgtemp_c'],
+        'humidity': day_data['avghumidity'],
+        'rainfall': day_data.get('totalprecip_mm', 0),
+        'condition': day_data['condition']['text'],
+        'max_temp': day_data['maxtemp_c'],
+        'min_temp': day_data['mintemp_c'],
+        'uv_index': day_data['uv'],
+        # Air Quality Data
+        'AQI': calculated_aqi,
+        'PM2.5': air_quality.get('pm2_5', 0),
+        'PM10': air_quality.get('pm10', 0),
+        'NO2': air_quality.get('no2', 0),
+        'SO2': air_quality.get('so2', 0),
+        'CO': air_quality.get('co', 0),
+        'O3': air_quality.get('o3', 0)
+    }
+
+def build_daily_records(location, forecastdays):
+    """build_daily_record for a whole forecastday list, scoring every day's AQI in one batch"""
+    scores = aqi.calculate_aqi_for_blocks([day['day'].get('air_quality') or {} for day in forecastdays])
+    return [build_daily_record(location, day['date'], day['day'], int(score))
+            for day, score in zip(forecastdays, scores)]
+
+def fetch_history_day(city, date):
+    """Fetch historical weather and air quality data for a single day"""
+    params = {
+        'q': location_resolver.upstream_query(city),
+        'dt': date,
+        'aqi': 'yes'
+    }
+    
+    data = weather_api.get_json("history.json", params)
+    
+    location = data['location']
+    location_resolver.learn(city, location)
+    day_data = data['forecast']['forecastday'][0]['day']
+    return build_daily_record(location, date, day_data)
+
+def history_ttl(date):
+    """Completed days never change; today's and yesterday's entries expire"""
+    return None if is_completed_day(date) else CACHE_TODAY_TTL
+
+def get_history_day(city, date):
+    """Get one history day, served from the cache when available"""
+    return get_cached(history_cache, 'history', city, lambda: fetch_history_day(city, date), date,
+                      ttl=history_ttl(date))
+
+def fetch_history_range(city, dates):
+    """Fetch consecutive days with a single dt..end_dt call; returns {date: record} for the days it covered"""
+    params = {
+        'q': location_resolver.upstream_query(city),
+        'dt': dates[0],
+        'end_dt': dates[-1],
+        'aqi': 'yes'
+    }
+    
+    data = weather_api.get_json("history.json", params)
+    
+    location = data['location']
+    location_resolver.learn(city, location)
+    wanted = set(dates)
+    days = [day for day in data['forecast']['forecastday'] if day['date'] in wanted]
+    records = {record['date']: record for record in build_daily_records(location, days)}
+    for date, record in records.items():
+        history_cache.set(cache_key('history', city, date), record, ttl=history_ttl(date))
+    return records
+
+def weatherapi_error_code(error):
+    """WeatherAPI's error code from an HTTPError's JSON body, or None"""
+    try:
+        return error.response.json()['error']['code']
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+def set_history_range_supported(supported):
+    global history_range_supported, history_range_checked_at
+    history_range_supported = supported
+    history_range_checked_at = time.monotonic()
+
+def get_history_range(city, dates):
+    """Range fetch that returns {} (so the caller falls back to per-day calls) when it fails"""
+    try:
+        records = fetch_history_range(city, dates)
+    except requests.HTTPError as e:
+        if HISTORY_RANGE_MODE != 'auto' or weatherapi_error_code(e) in WEATHERAPI_REQUEST_ERRORS:
+            logger.warning("Range history fetch for %s %s..%s failed: %s", city, dates[0], dates[-1], e)
+            return {}
+        # Only blame the range if the same location works with a single dt
+        try:
+            record = fetch_history_day(city, dates[0])
+        except Exception:
+            logger.warning("Range history fetch for %s %s..%s failed: %s", city, dates[0], dates[-1], e)
+            return {}
+        history_cache.set(cache_key('history', city, dates[0]), record, ttl=history_ttl(dates[0]))
+        set_history_range_supported(False)
+        logger.warning("history.json rejected a date range (%s); using per-day requests", e)
+        return {dates[0]: record}
+    except Exception as e:
+        logger.warning("Range history fetch for %s %s..%s failed: %s", city, dates[0], dates[-1], e)
+        return {}
+    
+    if HISTORY_RANGE_MODE == 'auto' and history_range_supported is not True:
+        # Providers that ignore end_dt answer with the first day only
+        set_history_range_supported(len(records) > 1)
+        if not history_range_supported:
+            logger.warning("history.json ignored end_dt; using per-day requests")
+    return records
+
+def history_ranges(dates, max_days):
+    """Split dates into runs of consecutive days (oldest first), each at most max_days long"""
+    ranges = []
+    for date in sorted(dates):
+        current = ranges[-1] if ranges else None
+        if (current and len(current) < max_days and
+                datetime.date.fromisoformat(date) - datetime.date.fromisoformat(current[-1]) == timedelta(days=1)):
+            current.append(date)
+        else:
+            ranges.append([date])
+    return ranges
+
+def history_priority(date):
+    """Background fetches of days older than QUOTA_BACKFILL_AFTER_DAYS are backfill work.
+
+    Everything else keeps the caller's priority: a user asking for 60 days is
+    waiting on every one of them.
+    """
+    priority = current_priority()
+    if priority == 'interactive':
+        return priority
+    cutoff = (datetime.datetime.now() - timedelta(days=QUOTA_BACKFILL_AFTER_DAYS)).strftime('%Y-%m-%d')
+    return 'backfill' if date < cutoff else priority
+
+def use_history_ranges():
+    if HISTORY_RANGE_MODE == 'on':
+        return True
+    if HISTORY_RANGE_MODE != 'auto':
+        return False
+    # A negative verdict is rechecked now and then, e.g. after a plan upgrade
+    return (history_range_supported is not False or
+            time.monotonic() - history_range_checked_at >= HISTORY_RANGE_RECHECK_INTERVAL)
+
+def load_stored_days(city, dates):
+    """Read completed days from the persistent history store"""
+    completed = [date for date in dates if is_completed_day(date)]
+    if not history_store or not completed:
+        return {}
+    try:
+        return history_store.get_days(location_key(city), completed)
+    except Exception as e:
+        logger.error("Error reading history store: %s", e)
+        return {}
+
+def save_stored_days(city, records):
+    """Persist newly fetched completed days"""
+    completed = [record for record in records if is_completed_day(record['date'])]
+    if not history_store or not completed:
+        return
     try:
-        historical_data = []
+        history_store.put_days(location_key(city), completed)
+    except Exception as e:
+        logger.error("Error writing history store: %s", e)
+
+def iter_history_days(city, dates, max_workers=None):
+    """Yield (date, record, error) for each requested day as soon as it is available.
+    
+    Stored days are yielded first; missing days are fetched concurrently and
+    yielded in completion order, with record None and the error message on failure.
+    Runs of consecutive missing days are fetched with one range call each when
+    ranges are enabled, falling back to per-day calls for any day a range missed.
+    Days still outstanding when the request's deadline passes are reported as failed.
+    """
+    stored = load_stored_days(city, dates)
+    for date in dates:
+        if date in stored:
+            yield date, stored[date], None
+    missing = [date for date in dates if date not in stored]
+    if not missing:
+        return
+    
+    fetched = []
+    max_workers = max(1, min(max_workers or HISTORY_FETCH_CONCURRENCY, len(missing)))
+    executor = ContextExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        if use_history_ranges():
+            # Days already cached are answered per day; the rest go out as date ranges
+            uncached = [date for date in missing if history_cache.get(cache_key('history', city, date)) is None]
+            for dates_in_range in history_ranges(uncached, HISTORY_RANGE_MAX_DAYS):
+                if len(dates_in_range) > 1:
+                    with request_priority(history_priority(dates_in_range[-1])):
+                        futures[executor.submit(get_history_range, city, dates_in_range)] = dates_in_range
+            in_ranges = {date for dates_in_range in futures.values() for date in dates_in_range}
+            missing = [date for date in missing if date not in in_ranges]
+        for date in missing:
+            with request_priority(history_priority(date)):
+                futures[executor.submit(get_history_day, city, date)] = date
         
-        for i in range(days):
-            date = (datetime.datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            
-            url = f"{WEATHER_API_BASE_URL}/history.json"
-            params = {
-                'key': WEATHER_API_KEY,
-                'q': city,
-                'dt': date,
-                'aqi': 'yes'
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            location = data['location']
-            day_data = data['forecast']['forecastday'][0]['day']
-            air_quality = day_data.get('air_quality', {})
-            
-            # Calculate AQI with comprehensive fallback logic
-            api_aqi = air_quality.get('us-epa-index', 0)
-            if api_aqi and api_aqi > 10:  # Only trust API AQI if it's reasonable
-                calculated_aqi = api_aqi
+        while futures:
+            try:
+                future = next(as_completed(futures, timeout=remaining()))
+            except FuturesTimeoutError:
+                mark_incomplete('history')
+                for requested in futures.values():
+                    for date in requested if isinstance(requested, list) else [requested]:
+                        yield date, None, 'deadline exceeded'
+                break
+            requested = futures.pop(future)
+            if isinstance(requested, list):
+                records = future.result()
+                for date in requested:
+                    if date in records:
+                        fetched.append(records[date])
+                        yield date, records[date], None
+                    else:
+                        # Not covered by the range response: fall back to a per-day call
+                        with request_priority(history_priority(date)):
+                            futures[executor.submit(get_history_day, city, date)] = date
+                continue
+            try:
+                record = future.result()
+            except Exception as e:
+                mark_incomplete('history')
+                yield requested, None, str(e)
             else:
-                # Calculate from ALL available pollutants
-                calculated_aqi = calculate_comprehensive_aqi(air_quality, location['name'])
-            
-            historical_data.append({
-                'city': location['name'],
-                'country': location['country'],
-                'latitude': location['lat'],
-                'longitude': location['lon'],
-                'date': date,
-                'temperature': day_data['avgtemp_c'],
-                'humidity': day_data['avghumidity'],
-                'rainfall': day_data.get('totalprecip_mm', 0),
-                'condition': day_data['condition']['text'],
-                'max_temp': day_data['maxtemp_c'],
-                'min_temp': day_data['mintemp_c'],
-                'uv_index': day_data['uv'],
-                # Air Quality Data
-                'AQI': calculated_aqi,
-                'PM2.5': air_quality.get('pm2_5', 0),
-                'PM10': air_quality.get('pm10', 0),
-                'NO2': air_quality.get('no2', 0),
-                'SO2': air_quality.get('so2', 0),
-                'CO': air_quality.get('co', 0),
-                'O3': air_quality.get('o3', 0)
-            })
-            
-        # Sort data chronologically (oldest to newest) for proper chart display
-        historical_data.sort(key=lambda x: x['date'])
-        return historical_data
-    except Exception as e:
-        print(f"Error fetching historical weather: {e}")
-        return []
+                fetched.append(record)
+                yield requested, record, None
+    finally:
+        # Don't wait for outstanding days if the consumer stopped early (e.g. client disconnect)
+        executor.shutdown(wait=False, cancel_futures=True)
+        save_stored_days(city, fetched)
+
+def fetch_history_days(city, dates, max_workers=None):
+    """Fetch several history days, reading stored days and fetching only missing ones.
+    
+    Returns (records, failures): records sorted oldest to newest, and a dict
+    mapping every date that could not be fetched to its error message.
+    """
+    records = []
+    failures = {}
+    for date, record, error in iter_history_days(city, dates, max_workers):
+        if error is None:
+            records.append(record)
+        else:
+            failures[date] = error
+    
+    # Keep the default anomaly window current with whatever days pass through here
+    tracker = anomaly_trackers.get((location_key(city), ANOMALY_WINDOW))
+    if tracker is not None and records:
+        tracker.observe(records)
+    
+    # Sort data chronologically (oldest to newest) for proper chart display
+    records.sort(key=lambda x: x['date'])
+    return records, failures
+
+def history_dates(days):
+    """Dates covered by a history request, today first"""
+    today = datetime.datetime.now()
+    return [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+
+def get_historical_weather_and_aqi(city="London", days=7):
+    """Get historical weather and air quality data for specified days"""
+    historical_data, failures = fetch_history_days(city, history_dates(days))
+    if failures:
+        logger.error("Error fetching historical weather for %s on %d of %d days: %s",
+                     city, len(failures), days, dict(sorted(failures.items())))
+    return historical_data
+
+def get_history_rollups(city, days, resolution):
+    """Weekly or monthly points covering the last `days` days, oldest first.
+    
+    Whole completed periods come straight from the rollups in the history
+    store; the partial periods at either end of the window (and any period
+    the store cannot fully answer) are aggregated from the daily records.
+    """
+    groups = group_by_period(history_dates(days), resolution)
+    whole = [period for period, dates in groups.items()
+             if len(dates) == period_length(period, resolution) and all(is_completed_day(date) for date in dates)]
+    stored = {}
+    if history_store and whole:
+        try:
+            stored = history_store.get_rollups(location_key(city), resolution, whole)
+        except Exception as e:
+            logger.error("Error reading history rollups: %s", e)
+    
+    points = [stored[period] for period in whole
+              if period in stored and stored[period]['days'] == len(groups[period])]
+    served = {point['date'] for point in points}
+    missing = [date for period, dates in groups.items() if period not in served for date in dates]
+    records, failures = fetch_history_days(city, missing)
+    if failures:
+        logger.error("Error fetching historical weather for %s on %d of %d days: %s",
+                     city, len(failures), len(missing), dict(sorted(failures.items())))
+    points.extend(rollup_records(records, resolution))
+    return sorted(points, key=lambda point: point['date'])
 
 def get_forecast_weather_and_aqi(city="London", days=3):
     """Get weather forecast with air quality for next few days"""
     try:
-        url = f"{WEATHER_API_BASE_URL}/forecast.json"
-        params = {
-            'key': WEATHER_API_KEY,
-            'q': city,
-            'days': days,
-            'aqi': 'yes',
-            'alerts': 'no'
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        location = data['location']
-        forecast_data = []
-        
-        for day in data['forecast']['forecastday']:
-            day_data = day['day']
-            air_quality = day_data.get('air_quality', {})
-            
-            # Calculate AQI with comprehensive fallback logic
-            api_aqi = air_quality.get('us-epa-index', 0)
-            if api_aqi and api_aqi > 10:  # Only trust API AQI if it's reasonable
-                calculated_aqi = api_aqi
-            else:
-                # Calculate from ALL available pollutants
-                calculated_aqi = calculate_comprehensive_aqi(air_quality, location['name'])
-            
-            forecast_data.append({
-                'city': location['name'],
-                'country': location['country'],
-                'latitude': location['lat'],
-                'longitude': location['lon'],
-                'date': day['date'],
-                'temperature': day_data['avgtemp_c'],
-                'humidity': day_data['avghumidity'],
-                'rainfall': day_data.get('totalprecip_mm', 0),
-                'condition': day_data['condition']['text'],
-                'max_temp': day_data['maxtemp_c'],
-                'min_temp': day_data['mintemp_c'],
-                'uv_index': day_data['uv'],
-                # Air Quality Data
-                'AQI': calculated_aqi,
-                'PM2.5': air_quality.get('pm2_5', 0),
-                'PM10': air_quality.get('pm10', 0),
-                'NO2': air_quality.get('no2', 0),
-                'SO2': air_quality.get('so2', 0),
-                'CO': air_quality.get('co', 0),
-                'O3': air_quality.get('o3', 0)
-            })
-            
-        return forecast_data
+        return get_cached(forecast_cache, 'forecast', city, lambda: fetch_forecast_weather_and_aqi(city, days), days,
+                          ttl=CACHE_FORECAST_TTL, nearby=True)
     except Exception as e:
-        print(f"Error fetching forecast: {e}")
+        logger.error("Error fetching forecast for %s: %s", city, e)
+        mark_incomplete('forecast')
         return []
 
+def fetch_forecast_weather_and_aqi(city, days):
+    """Fetch the weather forecast with air quality from WeatherAPI"""
+    params = {
+        'q': location_resolver.upstream_query(city),
+        'days': days,
+        'aqi': 'yes',
+        'alerts': 'no'
+    }
+    
+    data = weather_api.get_json("forecast.json", params)
+    
+    location = data['location']
+    location_resolver.learn(city, location)
+    return build_daily_records(location, data['forecast']['forecastday'])
+
+# Popular cities offered by /api/cities and used as the default batch
+POPULAR_CITIES = [
+    {'name': 'London', 'country': 'UK', 'region': 'City of London, Greater London', 'lat': 51.52, 'lon': -0.11},
+    {'name': 'New York', 'country': 'USA', 'region': 'New York', 'lat': 40.71, 'lon': -74.01},
+    {'name': 'Tokyo', 'country': 'Japan', 'region': 'Tokyo', 'lat': 35.69, 'lon': 139.69},
+    {'name': 'Delhi', 'country': 'India', 'region': 'Delhi', 'lat': 28.67, 'lon': 77.22},
+    {'name': 'Mumbai', 'country': 'India', 'region': 'Maharashtra', 'lat': 18.98, 'lon': 72.83},
+    {'name': 'Beijing', 'country': 'China', 'region': 'Beijing', 'lat': 39.93, 'lon': 116.39},
+    {'name': 'Los Angeles', 'country': 'USA', 'region': 'California', 'lat': 34.05, 'lon': -118.24},
+    {'name': 'Paris', 'country': 'France', 'region': 'Ile-de-France', 'lat': 48.87, 'lon': 2.33},
+    {'name': 'Sydney', 'country': 'Australia', 'region': 'New South Wales', 'lat': -33.88, 'lon': 151.22},
+    {'name': 'Dubai', 'country': 'UAE', 'region': 'Dubai', 'lat': 25.25, 'lon': 55.28}
+]
+
+def stream_history_frames(city, days, current_executor=None):
+    """Yield a 'day' frame per history record as it arrives, then a 'summary' frame.
+    
+    When current_executor is given, current conditions are fetched alongside the
+    history and sent as a 'current' frame once the days are done.
+    """
+    started = time.perf_counter()
+    current_future = current_executor.submit(get_current_weather_and_aqi, city) if current_executor else None
+    records = []
+    failures = {}
+    try:
+        for date, record, error in iter_history_days(city, history_dates(days)):
+            if error is None:
+                records.append(record)
+                yield 'day', {'data': record}
+            else:
+                failures[date] = error
+        if current_future is not None:
+            current_data = current_future.result()
+            if current_data:
+                yield 'current', {'data': current_data}
+        records.sort(key=lambda x: x['date'])
+        yield 'summary', {
+            'city': city,
+            'days_requested': days,
+            'days_returned': len(records),
+            'failed_dates': failures,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'records': records
+        }
+    finally:
+        if current_executor is not None:
+            current_executor.shutdown(wait=False, cancel_futures=True)
+
 @app.route('/api/data')
 def get_climate_data():
-    """Get combined historical and current climate data"""
+    """Get combined historical and current climate data
+    
+    With ?stream=ndjson or ?stream=sse each day is sent as soon as it is ready,
+    followed by the current conditions and a final summary frame. With
+    ?format=columnar the records are returned as one array per field.
+    ?resolution=week|month returns one aggregated point per calendar period
+    instead of daily records (never streamed, no current conditions).
+    """
     city = request.args.get('city', 'London')
     days = int(request.args.get('days', 7))
+    resolution = request.args.get('resolution', 'day').lower()
+    if resolution not in RESOLUTIONS:
+        return jsonify({'error': f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    
+    if resolution != 'day':
+        points = get_history_rollups(city, days, resolution)
+        return jsonify(to_columnar(points) if wants_columnar(request) else points)
+    
+    stream_mode = requested_stream_mode(request)
+    if stream_mode:
+        frames = stream_history_frames(city, days, current_executor=ContextExecutor(max_workers=1))
+        # The summary frame only needs counts and failures here; the days were already sent
+        return stream_response(((event, {k: v for k, v in payload.items() if k != 'records'})
+                                for event, payload in frames), stream_mode)
     
     try:
         # Get historical data
@@ -444,6 +883,8 @@ def get_climate_data():
         # Ensure chronological order (oldest to newest)
         all_data.sort(key=lambda x: x['date'])
         
+        if wants_columnar(request):
+            return jsonify(to_columnar(all_data))
         return jsonify(all_data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -464,41 +905,84 @@ def get_current_data():
 
 @app.route('/api/forecast')
 def get_forecast_data():
-    """Get weather forecast with air quality"""
+    """Get weather forecast with air quality (?format=columnar for one array per field)"""
     city = request.args.get('city', 'London')
     days = int(request.args.get('days', 3))
     
     try:
         data = get_forecast_weather_and_aqi(city, days)
+        if wants_columnar(request):
+            return jsonify(to_columnar(data))
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def aqi_category(value):
+    """Human readable AQI interpretation"""
+    if value <= 50:
+        return "good air quality"
+    elif value <= 100:
+        return "moderate air quality"
+    elif value <= 150:
+        return "unhealthy for sensitive groups"
+    elif value <= 200:
+        return "unhealthy air quality"
+    else:
+        return "very unhealthy air quality"
+
+def generate_cohere_summary(prompt):
+    """Generate summary text with Cohere, or None if the call fails, is shed or runs out of time"""
+    # Check the deadline first so an expired request spends no quota
+    if deadline_expired():
+        logger.warning("Skipping Cohere summary: deadline exceeded")
+        return None
+    try:
+        cohere_budget.acquire()
+    except QuotaExceededError as e:
+        logger.warning("Skipping Cohere summary: %s", e)
+        return None
+    left = remaining()
+    if left == 0:
+        logger.warning("Skipping Cohere summary: deadline exceeded while waiting for quota")
+        return None
+    with COHERE_REQUEST_DURATION.time(outcome='error') as labels:
+        try:
+            response = cohere_client.generate(
+                model="command",
+                prompt=prompt,
+                max_tokens=300,
+                temperature=0.7,
+                request_options={'timeout': left, 'max_retries': 0} if left is not None else None
+            )
+            summary = response.generations[0].text.strip()
+            labels['outcome'] = 'success'
+            return summary
+        except Exception as ce:
+            logger.error("Cohere API error: %s", ce)
+            return None
+
 @app.route('/api/summary')
 def get_summary():
-    """Generate summary based on current data"""
+    """Generate summary based on current data
+    
+    Current conditions and history are fetched in parallel. If the deadline
+    passes first, the summary uses the days that arrived (or the rule-based
+    text instead of Cohere) and 'complete' is false.
+    """
     city = request.args.get('city', 'London')
     
+    executor = ContextExecutor(max_workers=1)
     try:
-        current_data = get_current_weather_and_aqi(city)
+        current_future = executor.submit(get_current_weather_and_aqi, city)
         historical_data = get_historical_weather_and_aqi(city, 7)
+        current_data = current_future.result()
         
         if current_data and historical_data:
             avg_temp = sum(day['temperature'] for day in historical_data) / len(historical_data)
             avg_rainfall = sum(day['rainfall'] for day in historical_data) / len(historical_data)
             avg_aqi = sum(day['AQI'] for day in historical_data if day['AQI'] > 0) / max(1, len([d for d in historical_data if d['AQI'] > 0]))
             
-            # AQI interpretation
-            if avg_aqi <= 50:
-                aqi_status = "good air quality"
-            elif avg_aqi <= 100:
-                aqi_status = "moderate air quality"
-            elif avg_aqi <= 150:
-                aqi_status = "unhealthy for sensitive groups"
-            elif avg_aqi <= 200:
-                aqi_status = "unhealthy air quality"
-            else:
-                aqi_status = "very unhealthy air quality"
+            aqi_status = aqi_category(avg_aqi)
             
             # Compose a prompt for Cohere
             prompt = (
@@ -513,17 +997,19 @@ def get_summary():
             )
             cohere_summary = None
             if cohere_client:
-                try:
-                    response = cohere_client.generate(
-                        model="command",
-                        prompt=prompt,
-                        max_tokens=300,
-                        temperature=0.7
-                    )
-                    cohere_summary = response.generations[0].text.strip()
-                except Exception as ce:
-                    print(f"Cohere API error: {ce}")
-                    cohere_summary = None
+                # Similar conditions (rounded temperatures and rainfall, same AQI bands) share a summary
+                summary_key = (
+                    location_key(city),
+                    round(current_data['temperature']),
+                    round(avg_temp),
+                    round(avg_rainfall),
+                    aqi_category(current_data['AQI']),
+                    aqi_status
+                )
+                cohere_summary = summary_cache.get(summary_key, lambda: generate_cohere_summary(prompt),
+                                                   timeout=remaining())
+                if not cohere_summary:
+                    mark_incomplete('summary')
             # Fallback to basic summary if Cohere fails
             if cohere_summary:
                 summary = cohere_summary
@@ -534,96 +1020,438 @@ def get_summary():
                     f"Average rainfall is {avg_rainfall:.2f}mm. "
                     f"Current AQI is {current_data['AQI']}, indicating {aqi_status}."
                 )
-            return jsonify({'summary': summary})
+            incomplete = sorted(current_deadline().incomplete)
+            return jsonify({'summary': summary, 'days_used': len(historical_data),
+                            'complete': not incomplete, 'incomplete': incomplete})
         else:
-            return jsonify({'summary': 'Unable to generate summary at this time.'})
+            incomplete = sorted(current_deadline().incomplete)
+            return jsonify({'summary': 'Unable to generate summary at this time.',
+                            'complete': False, 'incomplete': incomplete})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    finally:
+        executor.shutdown(wait=False)
+
+def get_anomaly_tracker(city, window):
+    """Rolling statistics for a city and window size, created on first use"""
+    key = (location_key(city), window)
+    tracker = anomaly_trackers.get(key)
+    if tracker is None:
+        tracker = AnomalyTracker(window)
+        anomaly_trackers.set(key, tracker)
+    return tracker
+
+def update_anomaly_tracker(city, window):
+    """Feed the tracker the days it has not seen, plus the recent days that may still change"""
+    tracker = get_anomaly_tracker(city, window)
+    known = tracker.dates()
+    needed = [date for date in history_dates(window) if date not in known or not is_completed_day(date)]
+    records, failures = fetch_history_days(city, needed)
+    tracker.observe(records)
+    return tracker, failures
+
+def parse_anomaly_params(args):
+    """(metrics, z_threshold, window, seasonal) from the query string; raises ValueError"""
+    metrics = args.get('metrics', 'temperature')
+    metrics = list(ANOMALY_METRICS) if metrics == 'all' else [m.strip() for m in metrics.split(',') if m.strip()]
+    unknown = [metric for metric in metrics if metric not in ANOMALY_METRICS]
+    if unknown or not metrics:
+        raise ValueError(f"metrics must be 'all' or a list of: {', '.join(ANOMALY_METRICS)}")
+    z_threshold = float(args.get('z', ANOMALY_Z_THRESHOLD))
+    window = int(args.get('window', ANOMALY_WINDOW))
+    if not 5 <= window <= ANOMALY_MAX_WINDOW:
+        raise ValueError(f"window must be between 5 and {ANOMALY_MAX_WINDOW} days")
+    seasonal = args.get('baseline', 'rolling') == 'seasonal'
+    return metrics, z_threshold, window, seasonal
 
 @app.route('/api/anomalies')
 def get_anomalies():
-    """Detect temperature anomalies in historical data"""
+    """Detect anomalies in recent history
+    
+    Query parameters: metrics (comma list of temperature, AQI, PM2.5, humidity,
+    rainfall, or 'all'; default temperature), z (threshold in standard
+    deviations, default 2), window (days, default 30) and baseline=seasonal to
+    compare against per-month baselines.
+    
+    With ?stream=ndjson or ?stream=sse the window's days are sent as they arrive
+    and the final summary frame carries the anomalies.
+    """
     city = request.args.get('city', 'London')
+    try:
+        metrics, z_threshold, window, seasonal = parse_anomaly_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    stream_mode = requested_stream_mode(request)
+    if stream_mode:
+        def frames():
+            for event, payload in stream_history_frames(city, window):
+                if event == 'summary':
+                    tracker = get_anomaly_tracker(city, window)
+                    tracker.observe(payload.pop('records'))
+                    payload['anomalies'] = tracker.detect(z_threshold, metrics, seasonal)
+                yield event, payload
+        return stream_response(frames(), stream_mode)
     
     try:
-        historical_data = get_historical_weather_and_aqi(city, 30)  # Get 30 days for better anomaly detection
-        
-        if len(historical_data) < 5:
-            return jsonify([])
-            
-        temperatures = [day['temperature'] for day in historical_data]
-        avg_temp = sum(temperatures) / len(temperatures)
-        
-        # Calculate standard deviation
-        variance = sum((temp - avg_temp) ** 2 for temp in temperatures) / len(temperatures)
-        std_dev = variance ** 0.5
-        
-        # Find anomalies (temperatures more than 2 standard deviations from mean)
-        anomalies = []
-        for day in historical_data:
-            if abs(day['temperature'] - avg_temp) > 2 * std_dev:
-                anomalies.append({
-                    'date': day['date'],
-                    'temperature': day['temperature'],
-                    'deviation': abs(day['temperature'] - avg_temp)
-                })
-                
-        return jsonify(anomalies)
+        tracker, failures = update_anomaly_tracker(city, window)
+        return jsonify(tracker.detect(z_threshold, metrics, seasonal))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+"""
+Location search index
+Upstream search results are learned into a local prefix index seeded with the
+popular cities; autocomplete prefixes it already covers never leave the process.
+"""
+SEARCH_RESULT_LIMIT = 10
+SEARCH_INDEX_MAX_ENTRIES = int(os.getenv("SEARCH_INDEX_MAX_ENTRIES", 20000))
+
+def format_location(location):
+    """Search result in the shape the frontend expects"""
+    return {
+        'name': location['name'],
+        'country': location['country'],
+        'region': location.get('region', ''),
+        'lat': location['lat'],
+        'lon': location['lon'],
+        'display_name': f"{location['name']}, {location.get('region', '')}, {location['country']}"
+    }
+
+search_index = LocationIndex(limit=SEARCH_RESULT_LIMIT, max_entries=SEARCH_INDEX_MAX_ENTRIES)
+search_index.seed(format_location(city) for city in POPULAR_CITIES)
+
 @app.route('/api/search-locations')
 def search_locations():
-    """Search for locations using WeatherAPI search"""
+    """Search for locations, answering covered prefixes from the local index"""
     query = request.args.get('q', '')
     
     if not query or len(query) < 2:
         return jsonify([])
     
+    locations = search_index.lookup(query)
+    if locations is not None:
+        return jsonify(locations)
+    
     try:
-        url = f"{WEATHER_API_BASE_URL}/search.json"
-        params = {
-            'key': WEATHER_API_KEY,
-            'q': query
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = weather_api.get_json("search.json", {'q': query})
         
         # Format the response for frontend
-        locations = []
-        for location in data[:10]:  # Limit to 10 results
-            locations.append({
-                'name': location['name'],
-                'country': location['country'],
-                'region': location.get('region', ''),
-                'lat': location['lat'],
-                'lon': location['lon'],
-                'display_name': f"{location['name']}, {location.get('region', '')}, {location['country']}"
-            })
-            
+        locations = [format_location(location) for location in data[:SEARCH_RESULT_LIMIT]]
+        search_index.learn(query, locations)
+        location_resolver.learn_search_results(locations)
         return jsonify(locations)
     except Exception as e:
-        print(f"Error searching locations: {e}")
-        return jsonify([])
+        logger.error("Error searching locations for %r: %s", query, e)
+        # Best effort from what the index already knows
+        mark_incomplete('search')
+        return jsonify(search_index.lookup(query, covered_only=False))
 
 @app.route('/api/cities')
 def get_cities():
     """Get popular cities for selection"""
-    cities = [
-        {'name': 'London', 'country': 'UK'},
-        {'name': 'New York', 'country': 'USA'},
-        {'name': 'Tokyo', 'country': 'Japan'},
-        {'name': 'Delhi', 'country': 'India'},
-        {'name': 'Mumbai', 'country': 'India'},
-        {'name': 'Beijing', 'country': 'China'},
-        {'name': 'Los Angeles', 'country': 'USA'},
-        {'name': 'Paris', 'country': 'France'},
-        {'name': 'Sydney', 'country': 'Australia'},
-        {'name': 'Dubai', 'country': 'UAE'}
-    ]
-    return jsonify(cities)
+    return jsonify(POPULAR_CITIES)
+
+def fetch_city_batch(city, kind, days):
+    """Fetch one city for /api/batch; returns (data, error, failed_dates)"""
+    if kind == 'current':
+        data = get_current_weather_and_aqi(city)
+        return data, None if data else 'Failed to fetch current data', {}
+    if kind == 'forecast':
+        data = get_forecast_weather_and_aqi(city, days)
+        return data, None if data else 'Failed to fetch forecast data', {}
+    data, failures = fetch_history_days(city, history_dates(days))
+    return data, None if data else 'Failed to fetch historical data', failures
+
+@app.route('/api/batch', methods=['GET', 'POST'])
+def get_batch():
+    """Fetch current, forecast or history data for several cities in one request
+    
+    GET: ?cities=London,Paris&kind=current&days=3 (cities omitted, blank or 'all'
+    means every city from /api/cities). POST: the same fields as a JSON object,
+    with cities as a list.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    if not isinstance(params, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    kind = params.get('kind', 'current')
+    if kind not in BATCH_DEFAULT_DAYS:
+        return jsonify({'error': f"kind must be one of {', '.join(BATCH_DEFAULT_DAYS)}"}), 400
+    
+    try:
+        days = int(params.get('days', BATCH_DEFAULT_DAYS[kind]))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'days must be an integer'}), 400
+    
+    cities = params.get('cities', 'all')
+    if isinstance(cities, str):
+        cities = [name.strip() for name in cities.split(',')] if cities.strip().lower() not in ('', 'all') else None
+    elif cities is not None and not isinstance(cities, list):
+        return jsonify({'error': 'cities must be a list or a comma-separated string'}), 400
+    if not cities:
+        cities = [city['name'] for city in POPULAR_CITIES]
+    # Drop blanks and duplicates while keeping the requested order
+    cities = list(dict.fromkeys(city for city in cities if isinstance(city, str) and city.strip()))
+    if len(cities) > BATCH_MAX_CITIES:
+        return jsonify({'error': f'At most {BATCH_MAX_CITIES} cities per batch'}), 400
+    
+    results = {}
+    errors = {}
+    failed_dates = {}
+    executor = ContextExecutor(max_workers=max(1, min(BATCH_MAX_WORKERS, len(cities))))
+    try:
+        with request_priority('batch'):
+            futures = {executor.submit(fetch_city_batch, city, kind, days): city for city in cities}
+        for future in as_completed(futures, timeout=remaining()):
+            city = futures[future]
+            try:
+                data, error, failures = future.result()
+            except Exception as e:
+                data, error, failures = None, str(e), {}
+            if data:
+                results[city] = data
+            if error:
+                errors[city] = error
+            if failures:
+                failed_dates[city] = failures
+    except FuturesTimeoutError:
+        for city in cities:
+            if city not in results and city not in errors:
+                errors[city] = 'deadline exceeded'
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    if errors:
+        mark_incomplete('batch')
+    response = {
+        'kind': kind,
+        'cities': cities,
+        'results': {city: results[city] for city in cities if city in results},
+        'errors': errors,
+        'complete': not current_deadline().incomplete
+    }
+    if kind == 'history':
+        response['failed_dates'] = failed_dates
+    if not errors and not failed_dates:
+        # Partial batches are not worth caching
+        g.cache_policy = kind
+    return jsonify(response)
+
+"""
+Response compression
+gzip, or brotli when the brotli package is installed, chosen from Accept-Encoding.
+Registered before the other after_request hooks so it runs last, once the ETag
+has been computed from the uncompressed body.
+"""
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+@app.after_request
+def compress(response):
+    return compress_response(response, request, min_size=COMPRESSION_MIN_SIZE,
+                             gzip_level=COMPRESSION_GZIP_LEVEL, brotli_quality=COMPRESSION_BROTLI_QUALITY)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def request_deadline_seconds():
+    """Time budget for the current request in seconds, or None for no deadline"""
+    requested = request.headers.get('X-Timeout-Ms') or request.args.get('timeout_ms')
+    if requested:
+        try:
+            return min(max(float(requested) / 1000, 0.0), REQUEST_DEADLINE_MAX)
+        except ValueError:
+            pass
+    return ROUTE_DEADLINES.get(request.endpoint, REQUEST_DEADLINE_DEFAULT) or None
+
+@app.before_request
+def start_request_deadline():
+    g.deadline_token = start_deadline(request_deadline_seconds())
+
+@app.teardown_request
+def end_request_deadline(error=None):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        end_deadline(token)
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, route=route,
+                                      method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            HTTP_REQUEST_ERRORS.inc(route=route)
+    return response
+
+"""
+HTTP caching
+Cacheable routes answer with ETag/Last-Modified validators, 304 on revalidation
+and a Cache-Control policy matching how often their kind of data changes.
+"""
+HTTP_CACHE_POLICIES = {
+    'current': CachePolicy(CACHE_CURRENT_TTL, stale_while_revalidate=CACHE_CURRENT_TTL),
+    'forecast': CachePolicy(CACHE_FORECAST_TTL, stale_while_revalidate=CACHE_FORECAST_TTL),
+    # Only today's entry changes; older days are final
+    'history': CachePolicy(CACHE_TODAY_TTL, stale_while_revalidate=86400),
+    'summary': CachePolicy(summary_cache.fresh_ttl, stale_while_revalidate=summary_cache.max_stale),
+    'search': CachePolicy(86400, stale_while_revalidate=7 * 86400),
+    'cities': CachePolicy(86400, stale_while_revalidate=7 * 86400),
+}
+# View -> policy; /api/data includes the current reading, so it follows the current cadence
+ROUTE_CACHE_POLICIES = {
+    'get_climate_data': 'current',
+    'get_current_data': 'current',
+    'get_forecast_data': 'forecast',
+    'get_anomalies': 'history',
+    'get_summary': 'summary',
+    'search_locations': 'search',
+    'get_cities': 'cities',
+}
+conditional_responder = ConditionalResponder()
+
+@app.after_request
+def add_cache_headers(response):
+    """Validators, Cache-Control and 304 handling for cacheable routes"""
+    policy = g.pop('cache_policy', None) or ROUTE_CACHE_POLICIES.get(request.endpoint)
+    if policy is None:
+        return response
+    deadline = current_deadline()
+    if deadline is not None and deadline.incomplete:
+        # Partial answers must not be reused by browsers or proxies
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return conditional_responder.apply(response, request, HTTP_CACHE_POLICIES[policy])
+
+@app.after_request
+def add_completeness_headers(response):
+    """X-Complete (and X-Incomplete listing the missing parts) on /api responses"""
+    deadline = current_deadline()
+    if deadline is not None and request.path.startswith('/api/') and not response.is_streamed:
+        response.headers['X-Complete'] = 'false' if deadline.incomplete else 'true'
+        if deadline.incomplete:
+            response.headers['X-Incomplete'] = ','.join(sorted(deadline.incomplete))
+    return response
+
+def cache_samples(field):
+    """Gauge samples of one stats field across the response caches"""
+    all_stats = [cache.stats() for cache in (current_cache, history_cache, forecast_cache, summary_cache,
+                                             search_index, location_resolver)]
+    return [({'cache': stats['name']}, stats[field]) for stats in all_stats]
+
+REGISTRY.gauge("cache_hits_total", "Response cache hits", lambda: cache_samples('hits'), kind='counter')
+REGISTRY.gauge("cache_misses_total", "Response cache misses", lambda: cache_samples('misses'), kind='counter')
+REGISTRY.gauge("cache_entries", "Entries held by each response cache", lambda: cache_samples('entries'))
+REGISTRY.gauge("upstream_circuit_open", "1 while the upstream circuit breaker rejects requests",
+               lambda: [({'upstream': weather_api.name}, int(weather_api.breaker.state == 'open'))])
+REGISTRY.gauge("upstream_coalesced_requests_total", "Upstream calls served by joining an identical in-flight call",
+               lambda: [({'upstream': weather_api.name}, weather_api.single_flight.coalesced)], kind='counter')
+
+REGISTRY.gauge("upstream_budget_tokens", "Tokens left in each upstream bucket",
+               lambda: [({'provider': budget.name}, budget.stats()['tokens']) for budget in (weather_api_budget, cohere_budget)])
+REGISTRY.gauge("upstream_budget_month_used", "Upstream calls admitted this calendar month",
+               lambda: [({'provider': budget.name}, budget.month_used) for budget in (weather_api_budget, cohere_budget)])
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text-format metrics"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Hit/miss counters for the WeatherAPI response caches"""
+    return jsonify([cache.stats() for cache in (current_cache, history_cache, forecast_cache, summary_cache,
+                                                search_index, location_resolver)])
+
+@app.route('/api/quota')
+def get_quota_stats():
+    """Token buckets, monthly usage and admitted/shed counts per upstream provider"""
+    return jsonify([budget.stats() for budget in (weather_api_budget, cohere_budget)])
+
+"""
+Background pre-warming
+When PREWARM_ENABLED is set, current conditions, forecasts and recent history of
+the hot cities are refreshed every PREWARM_INTERVAL seconds, spread evenly over
+the interval. Warmed current/forecast entries live for at least one interval.
+"""
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "false").lower() in ("1", "true", "yes")
+PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", 300))
+PREWARM_HISTORY_DAYS = int(os.getenv("PREWARM_HISTORY_DAYS", 7))
+PREWARM_CITIES = [name.strip() for name in os.getenv("PREWARM_CITIES", "").split(",") if name.strip()] \
+    or [city['name'] for city in POPULAR_CITIES]
+
+def refresh_current(city):
+    """Re-fetch current conditions into the cache, replacing any cached entry"""
+    data = fetch_current_weather_and_aqi(city)
+    current_cache.set(cache_key('current', city), data, ttl=max(CACHE_CURRENT_TTL, PREWARM_INTERVAL))
+
+def refresh_forecast(city):
+    """Re-fetch the default 3-day forecast into the cache"""
+    data = fetch_forecast_weather_and_aqi(city, 3)
+    forecast_cache.set(cache_key('forecast', city, 3), data, ttl=max(CACHE_FORECAST_TTL, PREWARM_INTERVAL))
+
+def refresh_history(city):
+    """Fetch any recent day not yet cached or stored; newly completed days get persisted"""
+    _, failures = fetch_history_days(city, history_dates(PREWARM_HISTORY_DAYS))
+    if failures:
+        raise RuntimeError(f"{len(failures)} history days failed: {', '.join(sorted(failures))}")
+
+prewarm_scheduler = PrewarmScheduler(
+    PREWARM_CITIES,
+    {'current': prioritized('prefetch', refresh_current),
+     'forecast': prioritized('prefetch', refresh_forecast),
+     'history': prioritized('prefetch', refresh_history)},
+    interval=PREWARM_INTERVAL
+)
+if PREWARM_ENABLED:
+    prewarm_scheduler.start()
+
+"""
+Live current conditions
+Each subscribed city is polled once per LIVE_POLL_INTERVAL seconds no matter how
+many clients follow it; subscribers receive only the fields that changed.
+"""
+LIVE_POLL_INTERVAL = int(os.getenv("LIVE_POLL_INTERVAL", 60))
+LIVE_HEARTBEAT_INTERVAL = int(os.getenv("LIVE_HEARTBEAT_INTERVAL", 15))
+LIVE_MAX_CITIES = int(os.getenv("LIVE_MAX_CITIES", 20))
+live_hub = LiveHub(prioritized('batch', get_current_weather_and_aqi), interval=LIVE_POLL_INTERVAL)
+
+@app.route('/api/live')
+def get_live_updates():
+    """Server-Sent Events stream of current conditions for ?cities=London,Paris
+    
+    Sends a 'snapshot' event with the full record per city, then 'update' events
+    carrying only the changed fields.
+    """
+    cities = request.args.get('cities') or request.args.get('city', 'London')
+    cities = list(dict.fromkeys(name.strip() for name in cities.split(',') if name.strip()))
+    if not cities or len(cities) > LIVE_MAX_CITIES:
+        return jsonify({'error': f'Subscribe to between 1 and {LIVE_MAX_CITIES} cities'}), 400
+    
+    def frames():
+        subscription = live_hub.subscribe(cities)
+        try:
+            while not subscription.closed:
+                try:
+                    yield subscription.events.get(timeout=LIVE_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield None
+        finally:
+            live_hub.unsubscribe(subscription)
+    
+    return stream_response(frames(), 'sse')
+
+@app.route('/api/prewarm-status')
+def get_prewarm_status():
+    """Freshness of the pre-warmed cities"""
+    return jsonify({
+        'enabled': PREWARM_ENABLED,
+        'interval_seconds': PREWARM_INTERVAL,
+        'cities': prewarm_scheduler.status()
+    })
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,174 @@
+"""
+Table-driven EPA AQI engine
+
+Each pollutant has a breakpoint table of (C_lo, C_hi, I_lo, I_hi) segments.
+A concentration C falls in the first segment with C <= C_hi (the last segment
+catches everything above) and maps to
+
+    AQI = int((I_hi - I_lo) / (C_hi - C_lo) * (C - C_lo) + I_lo)
+
+The same tables drive a scalar lookup and a NumPy path that scores whole
+arrays of readings at once; both return identical values.
+"""
+from bisect import bisect_left
+
+import numpy as np
+
+# WeatherAPI reports every pollutant in µg/m³; EPA breakpoints use ppb for
+# NO2/SO2/O3 and ppm for CO.
+UNIT_CONVERSIONS = {
+    'no2': 0.532,     # µg/m³ -> ppb
+    'so2': 0.382,     # µg/m³ -> ppb
+    'co': 0.000873,   # µg/m³ -> ppm
+    'o3': 0.510,      # µg/m³ -> ppb
+}
+
+# Pollutant order used for batch results; keys match WeatherAPI air_quality fields
+POLLUTANTS = ('pm2_5', 'pm10', 'no2', 'so2', 'co', 'o3')
+
+
+class BreakpointTable:
+    """Piecewise-linear concentration -> index mapping for one pollutant"""
+
+    def __init__(self, segments, clamp_last=None):
+        self.segments = segments
+        self.clamp_last = clamp_last
+        # Upper bounds that select a segment; the last segment has no bound
+        self.uppers = [c_hi for _, c_hi, _, _ in segments[:-1]]
+        self.slopes = [(i_hi - i_lo) / (c_hi - c_lo) for c_lo, c_hi, i_lo, i_hi in segments]
+        self._uppers = np.array(self.uppers, dtype=float)
+        self._c_lo = np.array([c_lo for c_lo, _, _, _ in segments], dtype=float)
+        self._i_lo = np.array([i_lo for _, _, i_lo, _ in segments], dtype=float)
+        self._slopes = np.array(self.slopes, dtype=float)
+
+    def index(self, value, truncate=True):
+        """Sub-index for a single concentration"""
+        segment = bisect_left(self.uppers, value)
+        c_lo, _, i_lo, _ = self.segments[segment]
+        result = self.slopes[segment] * (value - c_lo) + i_lo
+        if not truncate:
+            return result
+        result = int(result)
+        if self.clamp_last and segment == len(self.segments) - 1:
+            low, high = self.clamp_last
+            result = max(low, min(high, result))
+        return result
+
+    def indices(self, values, truncate=True):
+        """Sub-indices for an array of concentrations (float array, truncated toward zero)"""
+        values = np.asarray(values, dtype=float)
+        segment = np.searchsorted(self._uppers, values, side='left')
+        result = self._slopes[segment] * (values - self._c_lo[segment]) + self._i_lo[segment]
+        if not truncate:
+            return result
+        result = np.trunc(result)
+        if self.clamp_last:
+            low, high = self.clamp_last
+            last = segment == len(self.segments) - 1
+            result[last] = np.clip(result[last], low, high)
+        return result
+
+
+BREAKPOINTS = {
+    'pm2_5': BreakpointTable([   # µg/m³
+        (0, 12.0, 0, 50),
+        (12.1, 35.4, 51, 100),
+        (35.5, 55.4, 101, 150),
+        (55.5, 150.4, 151, 200),
+        (150.5, 250.4, 201, 300),
+        (250.5, 350.4, 301, 400),
+        (350.5, 500.4, 401, 500),
+    ]),
+    'pm10': BreakpointTable([    # µg/m³
+        (0, 54, 0, 50),
+        (55, 154, 51, 100),
+        (155, 254, 101, 150),
+        (255, 354, 151, 200),
+        (355, 424, 201, 300),
+        (425, 604, 301, 500),
+    ]),
+    'no2': BreakpointTable([     # ppb
+        (0, 53, 0, 50),
+        (54, 100, 51, 100),
+        (101, 360, 101, 150),
+        (361, 649, 151, 200),
+        (650, 1249, 201, 300),
+        (1250, 2049, 301, 500),
+    ]),
+    'so2': BreakpointTable([     # ppb
+        (0, 35, 0, 50),
+        (36, 75, 51, 100),
+        (76, 185, 101, 150),
+        (186, 304, 151, 200),
+        (305, 604, 201, 300),
+        (605, 1004, 301, 500),
+    ]),
+    'co': BreakpointTable([      # ppm
+        (0, 4.4, 0, 50),
+        (4.5, 9.4, 51, 100),
+        (9.5, 12.4, 101, 150),
+        (12.5, 15.4, 151, 200),
+        (15.5, 30.4, 201, 300),
+        (30.5, 50.4, 301, 500),
+    ]),
+    'o3': BreakpointTable([      # ppb
+        (0, 54, 0, 50),
+        (55, 70, 51, 100),
+        (71, 85, 101, 150),
+        (86, 105, 151, 200),
+        (106, 200, 201, 300),
+        (201, 300, 301, 500),
+    ], clamp_last=(301, 500)),
+}
+
+
+def sub_index(pollutant, concentration):
+    """AQI sub-index for one concentration already in EPA units"""
+    return BREAKPOINTS[pollutant].index(concentration)
+
+
+def to_epa_units(pollutant, ugm3):
+    """Convert a WeatherAPI µg/m³ reading (scalar or array) to the unit of its breakpoint table"""
+    factor = UNIT_CONVERSIONS.get(pollutant)
+    return ugm3 * factor if factor is not None else ugm3
+
+
+def calculate_aqi_batch(readings):
+    """Score many sets of raw WeatherAPI readings (µg/m³) in one call.
+
+    readings maps pollutant keys from POLLUTANTS to equal-length sequences;
+    missing pollutants count as absent. Only positive readings contribute, as in
+    the scalar path. Returns a dict with an int array per pollutant (-1 where the
+    reading was absent or not positive) and 'aqi', the row-wise maximum (-1 where
+    no pollutant was available).
+    """
+    arrays = {key: np.asarray(values, dtype=float) for key, values in readings.items() if key in BREAKPOINTS}
+    if not arrays:
+        return {'aqi': np.array([], dtype=int)}
+    size = len(next(iter(arrays.values())))
+
+    results = {}
+    overall = np.full(size, -1, dtype=int)
+    for pollutant in POLLUTANTS:
+        raw = arrays.get(pollutant)
+        if raw is None:
+            continue
+        raw = np.nan_to_num(raw, nan=0.0)
+        available = raw > 0
+        scores = np.full(size, -1, dtype=int)
+        if available.any():
+            converted = to_epa_units(pollutant, raw[available])
+            scores[available] = BREAKPOINTS[pollutant].indices(converted).astype(int)
+        results[pollutant] = scores
+        np.maximum(overall, scores, out=overall)
+    results['aqi'] = overall
+    return results
+
+
+def calculate_aqi_for_blocks(air_quality_blocks):
+    """Batch AQI for a list of WeatherAPI air_quality dicts (-1 where no pollutant is available)"""
+    readings = {
+        pollutant: [block.get(pollutant, 0) or 0 for block in air_quality_blocks]
+        for pollutant in POLLUTANTS
+    }
+    return calculate_aqi_batch(readings)['aqi']
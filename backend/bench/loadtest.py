@@ -0,0 +1,201 @@
+"""
+Load test for the /api routes
+
+Drives each route with a fixed number of concurrent clients for a fixed time
+and reports throughput and p50/p95/p99 latency per route. Without --base-url
+it starts bench/mock_upstream.py and the backend in this process, so it needs
+no network access or API keys:
+
+    python bench/loadtest.py --concurrency 32 --duration 10
+    python bench/loadtest.py --routes current,data --upstream-latency-ms 150 --max-p95-ms 250
+    python bench/loadtest.py --upstream-fixture fixtures.json --upstream-hours 24
+    python bench/loadtest.py --base-url http://127.0.0.1:8000 --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CITIES = ['London', 'New York', 'Tokyo', 'Delhi', 'Mumbai', 'Beijing', 'Los Angeles', 'Paris', 'Sydney',
+          'Dubai', 'Berlin', 'Madrid', 'Manchester', 'Melbourne', 'Moscow']
+
+# Route name -> path template; {city} and {prefix} are filled per request
+ROUTES = {
+    'current': '/api/current?city={city}',
+    'data': '/api/data?city={city}&days=7',
+    'data-30': '/api/data?city={city}&days=30',
+    'data-30-columnar': '/api/data?city={city}&days=30&format=columnar',
+    'forecast': '/api/forecast?city={city}&days=3',
+    'summary': '/api/summary?city={city}',
+    'anomalies': '/api/anomalies?city={city}&metrics=all',
+    'search': '/api/search-locations?q={prefix}',
+    'cities': '/api/cities',
+    'batch': '/api/batch?kind=current',
+}
+DEFAULT_ROUTES = ['current', 'data', 'forecast', 'summary', 'anomalies', 'search', 'cities', 'batch']
+
+
+class RouteResult:
+    def __init__(self, route):
+        self.route = route
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, latency, ok):
+        with self._lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        latencies = np.array(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+        return {
+            'route': self.route,
+            'requests': len(latencies),
+            'errors': self.errors,
+            'rps': round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(float(latencies.max()), 2) if len(latencies) else 0.0,
+        }
+
+
+def request_paths(route, cities):
+    """Endless cycle of concrete paths for a route"""
+    template = ROUTES[route]
+    prefixes = [city[:length].lower() for city in cities for length in range(2, len(city) + 1)]
+    index = 0
+    while True:
+        yield template.format(city=quote(cities[index % len(cities)]), prefix=quote(prefixes[index % len(prefixes)]))
+        index += 1
+
+
+def run_route(base_url, route, cities, concurrency, duration, timeout):
+    result = RouteResult(route)
+    paths = request_paths(route, cities)
+    paths_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            with paths_lock:
+                path = next(paths)
+            started = time.perf_counter()
+            try:
+                ok = session.get(base_url + path, timeout=timeout).status_code < 400
+            except requests.RequestException:
+                ok = False
+            result.add(time.perf_counter() - started, ok)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def start_local_backend(args):
+    """Start the mock upstream and the Flask app in this process; returns the app's base URL"""
+    sys.path.insert(0, BACKEND_DIR)
+    from werkzeug.serving import make_server
+    from bench.mock_upstream import MockConfig, serve
+
+    mock_url = serve(MockConfig(args.upstream_latency_ms, args.upstream_jitter_ms, args.upstream_error_rate,
+                                args.cohere_latency_ms, seed=0, fixture=args.upstream_fixture,
+                                hours=args.upstream_hours, max_range_days=args.upstream_max_range_days), port=0)
+    os.environ.update({
+        'WEATHER_API_BASE_URL': f"{mock_url}/v1",
+        'COHERE_BASE_URL': mock_url,
+        'WEATHER_API_KEY': os.getenv('WEATHER_API_KEY') or 'mock',
+        'COHERE_API_KEY': os.getenv('COHERE_API_KEY') or 'mock',
+        'HISTORY_STORE_PATH': os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'history.db'),
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    })
+    import app as backend
+
+    # Per-request access logs would dominate the output
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="backend", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def print_table(summaries):
+    columns = ['route', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    widths = [max(len(column), *(len(str(summary[column])) for summary in summaries)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for summary in summaries:
+        print('  '.join(str(summary[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', help="backend to test; omit to start the mock and backend in-process")
+    parser.add_argument('--routes', default=','.join(DEFAULT_ROUTES), help=f"comma separated, from: {', '.join(ROUTES)}")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10, help="seconds per route")
+    parser.add_argument('--warmup', type=float, default=2, help="seconds per route before measuring")
+    parser.add_argument('--cities', type=int, default=len(CITIES), help="distinct cities to rotate through")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--upstream-latency-ms', type=float, default=50)
+    parser.add_argument('--upstream-jitter-ms', type=float, default=20)
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0)
+    parser.add_argument('--cohere-latency-ms', type=float, default=400)
+    parser.add_argument('--upstream-fixture', help="mock fixture file; its locations replace the default cities")
+    parser.add_argument('--upstream-hours', type=int, default=0, help="hourly entries per mock day (payload size)")
+    parser.add_argument('--upstream-max-range-days', type=int, default=30, help="longest mock history range")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--max-p95-ms', type=float, help="exit with status 1 if any route's p95 is above this")
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    unknown = [route for route in routes if route not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+    names = CITIES
+    if args.upstream_fixture and not args.base_url:
+        with open(args.upstream_fixture) as f:
+            names = [location['name'] for location in json.load(f).get('locations', [])] or CITIES
+    cities = names[:max(1, min(args.cities, len(names)))]
+
+    base_url = args.base_url.rstrip('/') if args.base_url else start_local_backend(args)
+
+    summaries = []
+    for route in routes:
+        if args.warmup:
+            run_route(base_url, route, cities, args.concurrency, args.warmup, args.timeout)
+        summaries.append(run_route(base_url, route, cities, args.concurrency, args.duration, args.timeout).summary())
+    print_table(summaries)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'base_url': base_url, 'concurrency': args.concurrency, 'duration': args.duration,
+                       'results': summaries}, f, indent=2)
+
+    if args.max_p95_ms is not None:
+        slow = [summary['route'] for summary in summaries if summary['p95_ms'] > args.max_p95_ms]
+        if slow:
+            print(f"p95 above {args.max_p95_ms} ms: {', '.join(slow)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
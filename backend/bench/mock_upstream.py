@@ -0,0 +1,311 @@
+"""
+Local stand-in for WeatherAPI and Cohere
+
+Serves current.json, history.json (including dt..end_dt ranges),
+forecast.json and search.json under /v1, plus Cohere's POST /v1/generate,
+with configurable latency, jitter and error rate. Payloads are deterministic
+for a given city and date, so repeated runs return the same data.
+
+Payloads are configurable too: --hours adds that many hourly entries to every
+day (WeatherAPI sends 24, which is most of a real response's size),
+--max-range-days caps the days one history.json range may return, and
+--fixture loads a JSON file of custom locations and day/current blocks:
+
+    {"locations": [{"name": "Reykjavik", "region": "Capital Region", "country": "Iceland",
+                    "lat": 64.15, "lon": -21.95}],
+     "days": {"Reykjavik": {"2026-01-05": {"avgtemp_c": -3.1, ...}}},
+     "current": {"Reykjavik": {"temp_c": -1.0, ...}}}
+
+Fixture locations replace the built-in city list; days and current blocks
+(keyed by location name, any case) are laid over the generated ones, so they
+only need the fields a test cares about.
+
+    python bench/mock_upstream.py --port 8001 --latency-ms 80 --error-rate 0.01
+    python bench/mock_upstream.py --fixture fixtures.json --hours 24
+
+then start the backend with
+WEATHER_API_BASE_URL=http://127.0.0.1:8001/v1 COHERE_BASE_URL=http://127.0.0.1:8001
+(and any non-empty WEATHER_API_KEY / COHERE_API_KEY).
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import timedelta
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+CITIES = [
+    ('London', 'City of London, Greater London', 'United Kingdom', 51.52, -0.11),
+    ('Londonderry', 'Londonderry', 'United Kingdom', 55.0, -7.32),
+    ('New York', 'New York', 'United States of America', 40.71, -74.01),
+    ('Tokyo', 'Tokyo', 'Japan', 35.69, 139.69),
+    ('Delhi', 'Delhi', 'India', 28.67, 77.22),
+    ('Mumbai', 'Maharashtra', 'India', 18.98, 72.83),
+    ('Beijing', 'Beijing', 'China', 39.93, 116.39),
+    ('Los Angeles', 'California', 'United States of America', 34.05, -118.24),
+    ('Paris', 'Ile-de-France', 'France', 48.87, 2.33),
+    ('Sydney', 'New South Wales', 'Australia', -33.88, 151.22),
+    ('Dubai', 'Dubai', 'United Arab Emirates', 25.25, 55.28),
+    ('Berlin', 'Berlin', 'Germany', 52.52, 13.4),
+    ('Madrid', 'Madrid', 'Spain', 40.4, -3.68),
+    ('Manchester', 'Manchester', 'United Kingdom', 53.48, -2.25),
+    ('Melbourne', 'Victoria', 'Australia', -37.82, 144.97),
+    ('Moscow', 'Moscow City', 'Russia', 55.75, 37.62),
+]
+
+
+class MockConfig:
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, cohere_latency_ms=400, seed=None,
+                 fixture=None, hours=0, max_range_days=30):
+        """fixture: path of a JSON fixture file (see the module docstring); hours: hourly entries per day"""
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.cohere_latency_ms = cohere_latency_ms
+        self.hours = hours
+        self.max_range_days = max_range_days
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.locations = CITIES
+        self.days = {}
+        self.current = {}
+        if fixture:
+            self.load_fixture(fixture)
+
+    def load_fixture(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('locations'):
+            self.locations = [(location['name'], location.get('region', ''), location.get('country', ''),
+                               float(location['lat']), float(location['lon'])) for location in data['locations']]
+        self.days = {name.lower(): days for name, days in data.get('days', {}).items()}
+        self.current = {name.lower(): block for name, block in data.get('current', {}).items()}
+
+    def day(self, location, date):
+        """Fixture day block for location and date, else a generated one"""
+        block = {**day_block(location, date), **self.days.get(location['name'].lower(), {}).get(date, {})}
+        if self.hours:
+            block = {**block, 'hour': hour_blocks(location, date, self.hours)}
+        return block
+
+    def current_block(self, location):
+        return {**current_block(location), **self.current.get(location['name'].lower(), {})}
+
+    def record(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def delay(self, latency_ms):
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self.random.random() < self.error_rate
+        time.sleep(max(0.0, latency_ms + jitter) / 1000)
+        return fail
+
+
+def resolve(query, cities=CITIES):
+    """Location block for q: a known city, "lat,lon", or any other name"""
+    query = query.strip()
+    try:
+        lat, lon = (float(part) for part in query.split(','))
+        name, region, country, lat, lon = min(cities, key=lambda c: (c[3] - lat) ** 2 + (c[4] - lon) ** 2)
+    except ValueError:
+        name = query.split(',')[0].strip().title()
+        match = next((city for city in cities if city[0].lower() == name.lower()), None)
+        if match is not None:
+            name, region, country, lat, lon = match
+        else:
+            # Unknown names still resolve, to a stable made-up place
+            seed = zlib.crc32(name.lower().encode())
+            region, country = name, 'Mockland'
+            lat, lon = round(seed % 180 - 90 + 0.5, 2), round(seed % 360 - 180 + 0.5, 2)
+    return {'name': name, 'region': region, 'country': country, 'lat': lat, 'lon': lon,
+            'tz_id': 'UTC', 'localtime': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M')}
+
+
+def air_quality(rng):
+    pm2_5 = round(rng.uniform(2, 80), 1)
+    return {
+        'co': round(rng.uniform(150, 900), 1),
+        'no2': round(rng.uniform(2, 80), 1),
+        'o3': round(rng.uniform(10, 120), 1),
+        'so2': round(rng.uniform(0.5, 20), 1),
+        'pm2_5': pm2_5,
+        'pm10': round(pm2_5 * rng.uniform(1.1, 2.0), 1),
+        'us-epa-index': 1 + int(pm2_5 // 20),
+        'gb-defra-index': 1 + int(pm2_5 // 12),
+    }
+
+
+def day_block(location, date):
+    rng = random.Random(f"{location['name']}|{date}")
+    avg = rng.uniform(-5, 32)
+    return {
+        'maxtemp_c': round(avg + rng.uniform(2, 8), 1),
+        'mintemp_c': round(avg - rng.uniform(2, 8), 1),
+        'avgtemp_c': round(avg, 1),
+        'maxwind_kph': round(rng.uniform(5, 40), 1),
+        'totalprecip_mm': round(max(0.0, rng.gauss(1.5, 3)), 2),
+        'avghumidity': rng.randint(30, 95),
+        'daily_chance_of_rain': rng.randint(0, 100),
+        'condition': {'text': rng.choice(['Sunny', 'Partly cloudy', 'Overcast', 'Light rain', 'Mist'])},
+        'uv': round(rng.uniform(0, 11), 1),
+        'air_quality': air_quality(rng),
+    }
+
+
+def hour_blocks(location, date, hours):
+    """`hours` evenly spaced hourly entries for the day"""
+    rng = random.Random(f"{location['name']}|{date}|hours")
+    step = 24 / hours
+    return [{
+        'time': f"{date} {int(index * step):02d}:00",
+        'temp_c': round(rng.uniform(-5, 32), 1),
+        'condition': {'text': rng.choice(['Sunny', 'Partly cloudy', 'Overcast', 'Light rain', 'Mist'])},
+        'wind_kph': round(rng.uniform(0, 40), 1),
+        'pressure_mb': rng.randint(990, 1035),
+        'precip_mm': round(max(0.0, rng.gauss(0.1, 0.3)), 2),
+        'humidity': rng.randint(30, 95),
+        'chance_of_rain': rng.randint(0, 100),
+    } for index in range(hours)]
+
+
+def current_block(location):
+    # Changes every 15 minutes, like WeatherAPI's update cadence
+    now = datetime.datetime.now(datetime.timezone.utc)
+    slot = now.replace(minute=now.minute - now.minute % 15, second=0, microsecond=0)
+    rng = random.Random(f"{location['name']}|{slot.isoformat()}")
+    return {
+        'last_updated_epoch': int(slot.timestamp()),
+        'last_updated': slot.strftime('%Y-%m-%d %H:%M'),
+        'temp_c': round(rng.uniform(-5, 35), 1),
+        'is_day': 1,
+        'condition': {'text': rng.choice(['Sunny', 'Partly cloudy', 'Overcast', 'Light rain'])},
+        'wind_kph': round(rng.uniform(0, 40), 1),
+        'pressure_mb': rng.randint(990, 1035),
+        'precip_mm': round(max(0.0, rng.gauss(0.2, 0.5)), 2),
+        'humidity': rng.randint(30, 95),
+        'uv': round(rng.uniform(0, 11), 1),
+        'air_quality': air_quality(rng),
+    }
+
+
+def create_app(config):
+    mock = Flask("mock_upstream")
+
+    def error(status, code, message):
+        return jsonify({'error': {'code': code, 'message': message}}), status
+
+    def respond(endpoint, build, latency_ms=None):
+        config.record(endpoint)
+        if config.delay(config.latency_ms if latency_ms is None else latency_ms):
+            return error(503, 9999, 'Injected failure')
+        return build()
+
+    @mock.route('/v1/current.json')
+    def current():
+        def build():
+            location = resolve(request.args.get('q', ''), config.locations)
+            return jsonify({'location': location, 'current': config.current_block(location)})
+        return respond('current.json', build)
+
+    @mock.route('/v1/history.json')
+    def history():
+        def build():
+            try:
+                start = datetime.date.fromisoformat(request.args['dt'])
+                end = datetime.date.fromisoformat(request.args.get('end_dt', request.args['dt']))
+            except (KeyError, ValueError):
+                return error(400, 1007, 'Parameter dt is missing or invalid.')
+            if end < start or (end - start).days > config.max_range_days:
+                return error(400, 1007, f'end_dt must be within {config.max_range_days} days after dt.')
+            location = resolve(request.args.get('q', ''), config.locations)
+            days = [{'date': (start + timedelta(days=offset)).isoformat(),
+                     'day': config.day(location, (start + timedelta(days=offset)).isoformat())}
+                    for offset in range((end - start).days + 1)]
+            return jsonify({'location': location, 'forecast': {'forecastday': days}})
+        return respond('history.json', build)
+
+    @mock.route('/v1/forecast.json')
+    def forecast():
+        def build():
+            location = resolve(request.args.get('q', ''), config.locations)
+            days = min(max(int(request.args.get('days', 1)), 1), 14)
+            today = datetime.date.today()
+            forecastday = [{'date': (today + timedelta(days=offset)).isoformat(),
+                            'day': config.day(location, (today + timedelta(days=offset)).isoformat())}
+                           for offset in range(days)]
+            return jsonify({'location': location, 'current': config.current_block(location),
+                            'forecast': {'forecastday': forecastday}})
+        return respond('forecast.json', build)
+
+    @mock.route('/v1/search.json')
+    def search():
+        def build():
+            query = request.args.get('q', '').strip().lower()
+            matches = [{'id': index, 'name': name, 'region': region, 'country': country, 'lat': lat, 'lon': lon,
+                        'url': name.lower().replace(' ', '-')}
+                       for index, (name, region, country, lat, lon) in enumerate(config.locations)
+                       if query and name.lower().startswith(query)]
+            return jsonify(matches)
+        return respond('search.json', build)
+
+    @mock.route('/v1/generate', methods=['POST'])
+    def generate():
+        def build():
+            prompt = (request.get_json(silent=True) or {}).get('prompt', '')
+            text = ("Conditions are typical for the season. Temperatures stay close to the weekly "
+                    "average and air quality is acceptable for most people. (mock summary, "
+                    f"{len(prompt)} prompt characters)")
+            return jsonify({'id': 'mock', 'generations': [{'id': 'mock-0', 'text': text}],
+                            'meta': {'api_version': {'version': '1'}}})
+        return respond('generate', build, config.cohere_latency_ms)
+
+    @mock.route('/calls')
+    def calls():
+        """Upstream calls served so far, per endpoint"""
+        with config.lock:
+            return jsonify(dict(config.calls))
+
+    return mock
+
+
+def serve(config, host='127.0.0.1', port=8001):
+    """Start the mock server on a daemon thread and return its base URL"""
+    server = make_server(host, port, create_app(config), threaded=True)
+    threading.Thread(target=server.serve_forever, name="mock-upstream", daemon=True).start()
+    return f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv("MOCK_PORT", 8001)))
+    parser.add_argument('--latency-ms', type=float, default=50, help="mean WeatherAPI latency")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="uniform +/- jitter on every call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument('--cohere-latency-ms', type=float, default=400, help="mean Cohere generate latency")
+    parser.add_argument('--seed', type=int, default=None, help="seed for jitter and injected errors")
+    parser.add_argument('--fixture', help="JSON file of custom locations and day/current blocks")
+    parser.add_argument('--hours', type=int, default=0, help="hourly entries per day (WeatherAPI sends 24)")
+    parser.add_argument('--max-range-days', type=int, default=30, help="longest dt..end_dt history range")
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    config = MockConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.cohere_latency_ms, args.seed,
+                        fixture=args.fixture, hours=args.hours, max_range_days=args.max_range_days)
+    server = make_server(args.host, args.port, create_app(config), threaded=True)
+    print(f"Mock WeatherAPI at http://{args.host}:{args.port}/v1, Cohere at http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
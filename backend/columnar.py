@@ -0,0 +1,39 @@
+"""
+Columnar layout for time-series responses
+
+Instead of a list of records that each repeat the location and every field
+name, the location is sent once and each metric becomes one array aligned
+with 'date'. Fields missing from some records are filled with null.
+"""
+
+LOCATION_FIELDS = ('city', 'country', 'latitude', 'longitude')
+
+
+def to_columnar(records):
+    """{'location': {...}, 'count': n, 'columns': {field: [...]}} for a list of records"""
+    location = {}
+    for field in LOCATION_FIELDS:
+        values = {record.get(field) for record in records}
+        if len(values) == 1:
+            location[field] = values.pop()
+
+    fields = []
+    for record in records:
+        for field in record:
+            if field not in location and field not in fields:
+                fields.append(field)
+    # Keep 'date' first so clients can treat it as the index column
+    if 'date' in fields:
+        fields.remove('date')
+        fields.insert(0, 'date')
+
+    return {
+        'location': location,
+        'count': len(records),
+        'columns': {field: [record.get(field) for record in records] for field in fields},
+    }
+
+
+def wants_columnar(request):
+    """True when the client asked for ?format=columnar"""
+    return request.args.get('format', '').lower() == 'columnar'
@@ -0,0 +1,46 @@
+"""
+Response compression negotiated from Accept-Encoding
+
+Brotli is preferred when the brotli package is installed and the client
+accepts it, then gzip. Small bodies, streams and already encoded responses are
+sent as is.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/csv')
+
+
+def choose_encoding(accept_encodings):
+    """Best supported encoding from the request's Accept-Encoding, or None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, request, min_size=1024, gzip_level=6, brotli_quality=4):
+    """Compress a buffered 200 response in place when the client accepts it"""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed or response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=brotli_quality)
+    else:
+        data = gzip.compress(data, compresslevel=gzip_level)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
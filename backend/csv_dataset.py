@@ -0,0 +1,105 @@
+"""
+In-memory dataset for the CSV backend (app_csv_backup.py)
+
+The CSV is read once, in chunks and through a memory map so multi-million-row
+files never need a second full copy in memory. Derived columns (AQI, rainfall)
+are computed with vectorized operations per chunk, and everything the routes
+return is built right after loading; the /api/data body is kept as encoded
+JSON bytes so a request never re-serializes the rows. Later calls only stat the file and reload
+when its mtime or size changes; requests keep using the previous snapshot
+while a reload is in progress.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from json_provider import dumps
+
+logger = logging.getLogger(__name__)
+
+FLOAT_COLUMNS = ['PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'O3', 'Temperature', 'Humidity']
+RENAMED_COLUMNS = {'City': 'city', 'Date': 'date', 'Temperature': 'temperature'}
+DATA_COLUMNS = ['city', 'date', 'temperature', 'rainfall', 'AQI', 'PM2.5', 'PM10', 'Humidity']
+ENCODE_CHUNK_ROWS = 100000
+
+
+def synthetic_rainfall(frame):
+    """Rainfall derived from humidity, with noise fixed per (city, date) so every route sees the same value"""
+    hashes = pd.util.hash_pandas_object(frame[['City', 'Date']], index=False).to_numpy()
+    noise = (hashes >> np.uint64(11)).astype(np.float64) / float(1 << 53)  # uniform in [0, 1)
+    return (frame['Humidity'] / 100) * noise * 10
+
+
+def records_json(frame):
+    """JSON array of the frame's rows as objects, encoded a slice at a time so no full dict list is built"""
+    parts = []
+    for start in range(0, len(frame), ENCODE_CHUNK_ROWS):
+        rows = frame.iloc[start:start + ENCODE_CHUNK_ROWS].to_dict(orient='records')
+        parts.append(dumps(rows)[1:-1])
+    return ('[' + ','.join(parts) + ']').encode()
+
+
+class Snapshot:
+    """One loaded version of the file with its prebuilt responses"""
+
+    def __init__(self, frame, version):
+        self.frame = frame
+        self.version = version
+        self.records_json = records_json(frame.rename(columns=RENAMED_COLUMNS)[DATA_COLUMNS])
+        self.averages = {
+            'temperature': round(float(frame['Temperature'].mean()), 2),
+            'rainfall': round(float(frame['rainfall'].mean()), 2),
+            'AQI': round(float(frame['AQI'].mean()), 2),
+        }
+        threshold = frame['Temperature'].mean() + 2 * frame['Temperature'].std()
+        self.anomalies = frame[frame['Temperature'] > threshold].rename(columns=RENAMED_COLUMNS)[
+            ['city', 'date', 'temperature']].to_dict(orient='records')
+
+
+class CSVDataset:
+    """Lazily loaded, mtime-checked dataset with derived columns"""
+
+    def __init__(self, path, derive, chunksize=500000):
+        """derive(chunk) adds derived columns to a raw chunk in place"""
+        self.path = path
+        self.derive = derive
+        self.chunksize = chunksize
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _file_version(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        """Current snapshot, reloading first if the file changed on disk"""
+        version = self._file_version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            # Another request may have reloaded while we waited
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+            return self._snapshot
+
+    def _load(self, version):
+        chunks = []
+        dtypes = {'City': 'object', 'Date': 'object', **{column: 'float64' for column in FLOAT_COLUMNS}}
+        reader = pd.read_csv(self.path, chunksize=self.chunksize, memory_map=True, dtype=dtypes)
+        for chunk in reader:
+            self.derive(chunk)
+            chunk['City'] = chunk['City'].astype('category')
+            chunks.append(chunk)
+        if chunks:
+            frame = pd.concat(chunks, ignore_index=True)
+        else:
+            frame = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+            self.derive(frame)
+        # Categories differ per chunk; unify them so the city column stays compact
+        frame['City'] = frame['City'].astype('category')
+        logger.info("Loaded %d rows from %s", len(frame), self.path)
+        return Snapshot(frame, version)
@@ -0,0 +1,85 @@
+"""
+Per-request deadlines
+
+Each request runs under a Deadline held in a context variable, so it follows
+the work into ContextExecutor threads. Upstream calls clamp their timeouts,
+retries and quota waits to the time left; code waiting on several results
+stops at the deadline and returns what has arrived. Whatever part of a
+response was cut short or failed is recorded with mark_incomplete so the
+response can say it is partial.
+"""
+import contextvars
+import threading
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before this step could finish"""
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        """seconds: time budget from now, or None for no limit (incomplete parts are still tracked)"""
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.incomplete = set()
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left (never negative), or None without a limit"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def mark_incomplete(self, part):
+        with self._lock:
+            self.incomplete.add(part)
+
+
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+def start_deadline(seconds=None):
+    """Put the current context under a new Deadline; returns the token for end_deadline"""
+    return _deadline.set(Deadline(seconds))
+
+
+def end_deadline(token):
+    _deadline.reset(token)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left for the current request, or None when there is no deadline"""
+    deadline = _deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def expired():
+    deadline = _deadline.get()
+    return deadline is not None and deadline.expired()
+
+
+def check_deadline(what):
+    """Raise DeadlineExceeded if the current request has no time left for `what`"""
+    if expired():
+        raise DeadlineExceeded(f"deadline exceeded before {what}")
+
+
+def clamp_timeout(timeout):
+    """timeout, shortened to the time the current request has left"""
+    left = remaining()
+    return timeout if left is None else min(timeout, left)
+
+
+def mark_incomplete(part):
+    """Record that `part` of the current response is missing or partial"""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.mark_incomplete(part)
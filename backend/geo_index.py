@@ -0,0 +1,94 @@
+"""
+Grid index for nearest-location lookups
+
+Points are bucketed into cells of cell_km x cell_km (longitude cells are
+measured at the equator and simply cover more of them towards the poles), so a
+radius query only scans the few cells around the query point and stays well
+under a millisecond with tens of thousands of points. Near the poles, where a
+radius spans thousands of longitude cells, only the occupied cells of each row
+are visited.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """Bounded grid of (ident -> lat, lon); the oldest points go first when full"""
+
+    def __init__(self, cell_km=1.0, max_entries=50000):
+        self.cell_degrees = max(cell_km, 0.01) / KM_PER_DEGREE
+        self.ring = math.ceil(360 / self.cell_degrees)  # longitude cells around the globe
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._points = OrderedDict()  # ident -> (lat, lon, cell)
+        self._cells = {}              # cell -> set of idents
+        self._row_columns = {}        # row -> occupied columns
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor((lon + 180) % 360 / self.cell_degrees))
+
+    def add(self, ident, lat, lon):
+        cell = self._cell(lat, lon)
+        with self._lock:
+            self._discard(ident)
+            self._points[ident] = (lat, lon, cell)
+            self._cells.setdefault(cell, set()).add(ident)
+            self._row_columns.setdefault(cell[0], set()).add(cell[1])
+            while len(self._points) > self.max_entries:
+                self._discard(next(iter(self._points)))
+
+    def _discard(self, ident):
+        point = self._points.pop(ident, None)
+        if point is not None:
+            members = self._cells[point[2]]
+            members.discard(ident)
+            if not members:
+                del self._cells[point[2]]
+                row, column = point[2]
+                self._row_columns[row].discard(column)
+                if not self._row_columns[row]:
+                    del self._row_columns[row]
+
+    def nearby(self, lat, lon, radius_km):
+        """[(distance_km, ident)] within radius_km of (lat, lon), nearest first"""
+        row, column = self._cell(lat, lon)
+        rows = math.ceil(radius_km / KM_PER_DEGREE / self.cell_degrees)
+        # A degree of longitude shrinks with cos(latitude); near the poles scan the whole ring
+        shrink = math.cos(math.radians(min(abs(lat) + rows * self.cell_degrees, 90.0)))
+        columns = min(math.ceil(rows / shrink), self.ring) if shrink > 1e-6 else self.ring
+        span = min(2 * columns + 1, self.ring)
+        found = []
+        with self._lock:
+            for cell_row in range(row - rows, row + rows + 1):
+                occupied = self._row_columns.get(cell_row)
+                if not occupied:
+                    continue
+                if len(occupied) < span:
+                    # Fewer occupied cells than cells in the window (always the case near the poles)
+                    cell_columns = [cell_column for cell_column in occupied
+                                    if min((cell_column - column) % self.ring, (column - cell_column) % self.ring) <= columns]
+                else:
+                    # Wrap around the antimeridian
+                    cell_columns = {cell_column % self.ring for cell_column in range(column - columns, column + columns + 1)}
+                for cell_column in cell_columns:
+                    for ident in self._cells.get((cell_row, cell_column), ()):
+                        point_lat, point_lon, _ = self._points[ident]
+                        distance = haversine_km(lat, lon, point_lat, point_lon)
+                        if distance <= radius_km:
+                            found.append((distance, ident))
+        found.sort()
+        return found
+
+    def __len__(self):
+        return len(self._points)
@@ -0,0 +1,18 @@
+"""
+Gunicorn settings, picked up automatically by `gunicorn app:app` from this directory
+
+GUNICORN_WORKER_CLASS=gevent serves every request on a cooperative event loop:
+blocking socket I/O (WeatherAPI through requests, Cohere, SSE streams) yields
+to other requests instead of holding a worker, so one process can keep
+hundreds of dashboard sessions in flight. The routes, thread pools and locks
+in app.py run unchanged because gevent patches them into greenlets.
+"""
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+# Concurrent connections per gevent worker
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+# Threads per gthread worker
+threads = int(os.getenv("GUNICORN_THREADS", 1))
+# The app must be imported after gevent has patched the standard library
+preload_app = False
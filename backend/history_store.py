@@ -0,0 +1,224 @@
+"""
+Persistent on-disk store for daily history records (SQLite)
+
+Completed history days never change, so once fetched they are kept here and
+shared across restarts and gunicorn workers. Compaction drops days older than
+the retention window and caps the total number of rows.
+
+Weekly and monthly rollups are kept next to the days. Storing a day
+recomputes only the week and month containing it, and rollups outlive the
+daily rows that compaction removes; they have their own, longer retention
+window and row cap.
+
+Location aliases ('london' -> its canonical id and upstream query) are kept
+too, so a restarted or additional worker reads days and rollups under the same
+key the first one stored them under.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import datetime
+from datetime import timedelta
+
+from rollups import aggregate, period_end, period_start
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_records (
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,
+    record TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (location, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_records_stored_at ON daily_records (stored_at);
+CREATE TABLE IF NOT EXISTS rollups (
+    location TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    period TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (location, resolution, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    location TEXT NOT NULL,
+    query TEXT NOT NULL,
+    stored_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_aliases_stored_at ON aliases (stored_at);
+"""
+ROLLUP_RESOLUTIONS = ('week', 'month')
+
+
+class HistoryStore:
+    """SQLite-backed store of daily records keyed by (location, date)"""
+
+    def __init__(self, path, retention_days=400, max_rows=500000, compact_every=500, max_aliases=50000,
+                 rollup_retention_days=1825, max_rollups=100000):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.rollup_retention_days = rollup_retention_days
+        self.max_rollups = max_rollups
+        self.max_aliases = max_aliases
+        self.compact_every = compact_every
+        self._local = threading.local()
+        self._writes_lock = threading.Lock()
+        self._writes_since_compaction = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        # auto_vacuum only takes effect when set before the first table is created
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._backfill_rollups()
+        self.compact()
+
+    def _connection(self):
+        """One connection per thread; WAL lets several workers read while one writes"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_days(self, location, dates):
+        """Return {date: record} for the requested dates that are stored"""
+        if not dates:
+            return {}
+        placeholders = ','.join('?' * len(dates))
+        rows = self._connection().execute(
+            f"SELECT date, record FROM daily_records WHERE location = ? AND date IN ({placeholders})",
+            [location, *dates]
+        ).fetchall()
+        return {date: json.loads(record) for date, record in rows}
+
+    def put_days(self, location, records):
+        """Store daily records (each must carry its 'date')"""
+        if not records:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily_records (location, date, record, stored_at) VALUES (?, ?, ?, ?)",
+                [(location, record['date'], json.dumps(record), now) for record in records]
+            )
+            self._update_rollups(conn, location, [record['date'] for record in records])
+        with self._writes_lock:
+            self._writes_since_compaction += len(records)
+            due = self._writes_since_compaction >= self.compact_every
+            if due:
+                self._writes_since_compaction = 0
+        if due:
+            self.compact()
+
+    def _update_rollups(self, conn, location, dates):
+        """Recompute the weekly and monthly rollups containing the given dates"""
+        for resolution in ROLLUP_RESOLUTIONS:
+            for period in {period_start(date, resolution) for date in dates}:
+                rows = conn.execute(
+                    "SELECT record FROM daily_records WHERE location = ? AND date BETWEEN ? AND ?",
+                    (location, period, period_end(period, resolution))
+                ).fetchall()
+                rollup = aggregate([json.loads(record) for (record,) in rows], resolution, period)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rollups (location, resolution, period, days, record) VALUES (?, ?, ?, ?, ?)",
+                    (location, resolution, period, rollup['days'], json.dumps(rollup))
+                )
+
+    def _backfill_rollups(self):
+        """Build rollups for days stored before rollups existed"""
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+            return
+        dates_by_location = {}
+        for location, date in conn.execute("SELECT location, date FROM daily_records"):
+            dates_by_location.setdefault(location, []).append(date)
+        with conn:
+            for location, dates in dates_by_location.items():
+                self._update_rollups(conn, location, dates)
+
+    def get_rollups(self, location, resolution, periods):
+        """Return {period: rollup} for the requested periods that have one"""
+        if not periods:
+            return {}
+        placeholders = ','.join('?' * len(periods))
+        rows = self._connection().execute(
+            f"SELECT period, record FROM rollups WHERE location = ? AND resolution = ? AND period IN ({placeholders})",
+            [location, resolution, *periods]
+        ).fetchall()
+        return {period: json.loads(record) for period, record in rows}
+
+    def get_alias(self, alias):
+        """Return (location, query) stored for alias, or None"""
+        return self._connection().execute(
+            "SELECT location, query FROM aliases WHERE alias = ?", (alias,)
+        ).fetchone()
+
+    def put_aliases(self, aliases, location, query):
+        """Record that every alias names location, fetched upstream as query"""
+        if not aliases:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO aliases (alias, location, query, stored_at) VALUES (?, ?, ?, ?)",
+                [(alias, location, query, now) for alias in aliases]
+            )
+
+    def compact(self):
+        """Apply the retention policy and give freed pages back to the filesystem"""
+        conn = self._connection()
+        now = datetime.datetime.now()
+        cutoff = (now - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        rollup_cutoff = (now - timedelta(days=self.rollup_retention_days)).strftime('%Y-%m-%d')
+        with conn:
+            conn.execute("DELETE FROM daily_records WHERE date < ?", (cutoff,))
+            (rows,) = conn.execute("SELECT COUNT(*) FROM daily_records").fetchone()
+            if rows > self.max_rows:
+                # Drop the least recently stored rows first
+                conn.execute(
+                    "DELETE FROM daily_records WHERE (location, date) IN "
+                    "(SELECT location, date FROM daily_records ORDER BY stored_at LIMIT ?)",
+                    (rows - self.max_rows,)
+                )
+            # A rollup goes once its whole period is past the retention window
+            conn.execute("DELETE FROM rollups WHERE period < ? AND "
+                         "((resolution = 'week' AND date(period, '+6 days') < ?) OR "
+                         "(resolution = 'month' AND date(period, '+1 month', '-1 day') < ?))",
+                         (rollup_cutoff, rollup_cutoff, rollup_cutoff))
+            (rollups,) = conn.execute("SELECT COUNT(*) FROM rollups").fetchone()
+            if rollups > self.max_rollups:
+                # Drop the oldest periods first
+                conn.execute(
+                    "DELETE FROM rollups WHERE (location, resolution, period) IN "
+                    "(SELECT location, resolution, period FROM rollups ORDER BY period LIMIT ?)",
+                    (rollups - self.max_rollups,)
+                )
+            (aliases,) = conn.execute("SELECT COUNT(*) FROM aliases").fetchone()
+            if aliases > self.max_aliases:
+                conn.execute(
+                    "DELETE FROM aliases WHERE alias IN (SELECT alias FROM aliases ORDER BY stored_at LIMIT ?)",
+                    (aliases - self.max_aliases,)
+                )
+        conn.execute("PRAGMA incremental_vacuum")
+
+    def stats(self):
+        conn = self._connection()
+        rows, locations = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT location) FROM daily_records"
+        ).fetchone()
+        (rollups,) = conn.execute("SELECT COUNT(*) FROM rollups").fetchone()
+        (aliases,) = conn.execute("SELECT COUNT(*) FROM aliases").fetchone()
+        return {'path': self.path, 'rows': rows, 'locations': locations, 'rollups': rollups, 'aliases': aliases,
+                'retention_days': self.retention_days, 'max_rows': self.max_rows,
+                'rollup_retention_days': self.rollup_retention_days, 'max_rollups': self.max_rollups}
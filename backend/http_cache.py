@@ -0,0 +1,56 @@
+"""
+HTTP caching headers and conditional GET for the JSON API
+
+Every cacheable response gets a weak ETag derived from its body, a
+Last-Modified time recording when that body version was first served for the
+URL, and a Cache-Control policy chosen per kind of data. Requests carrying a
+matching If-None-Match or a recent enough If-Modified-Since get a 304 with no
+body.
+"""
+import hashlib
+import time
+
+from cache import TTLCache
+
+
+class CachePolicy:
+    """Cache-Control values for one kind of data"""
+
+    def __init__(self, max_age, stale_while_revalidate=0):
+        self.max_age = int(max_age)
+        self.stale_while_revalidate = int(stale_while_revalidate)
+
+    def header(self):
+        value = f"public, max-age={self.max_age}"
+        if self.stale_while_revalidate:
+            value += f", stale-while-revalidate={self.stale_while_revalidate}"
+        return value
+
+
+class ConditionalResponder:
+    """Adds validators to responses and turns revalidations into 304s"""
+
+    def __init__(self, max_urls=10000):
+        # URL -> (etag, first time this etag was served), the data version per URL
+        self._versions = TTLCache("http_validators", max_entries=max_urls)
+
+    def apply(self, response, request, policy):
+        if request.method not in ('GET', 'HEAD') or response.is_streamed:
+            return response
+        if response.status_code != 200:
+            # Never let a cache hold on to an error
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        etag = hashlib.sha1(response.get_data()).hexdigest()[:32]
+        response.set_etag(etag, weak=True)
+        response.last_modified = self._first_served(request.full_path, etag)
+        response.headers['Cache-Control'] = policy.header()
+        return response.make_conditional(request)
+
+    def _first_served(self, url, etag):
+        version = self._versions.get(url)
+        if version is None or version[0] != etag:
+            # HTTP dates have one-second resolution
+            version = (etag, int(time.time()))
+            self._versions.set(url, version)
+        return version[1]
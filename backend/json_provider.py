@@ -0,0 +1,52 @@
+"""
+Fast JSON serialization
+
+orjson is used when it is installed (several times faster than the standard
+library on large lists of records); otherwise everything falls back to json.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Sorted keys like Flask's default; dates go through _default so they format the same way
+_ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                   | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+def dumps(obj):
+    """Compact JSON text for obj"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode()
+    return json.dumps(obj, separators=(',', ':'), default=_default)
+
+
+def _default(obj):
+    # Mirror Flask's DefaultJSONProvider for dates, dataclasses and friends
+    return DefaultJSONProvider.default(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when available"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = _ORJSON_OPTIONS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = _ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        # Bytes straight from orjson; no str round-trip on large payloads
+        return self._app.response_class(orjson.dumps(obj, default=_default, option=option), mimetype=self.mimetype)
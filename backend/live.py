@@ -0,0 +1,98 @@
+"""
+Live current-conditions hub
+
+Clients subscribe to a set of cities. Each city that has at least one
+subscriber is polled once per interval by a single background thread, and
+only the fields that changed since the previous poll are fanned out to every
+subscriber. Upstream traffic therefore grows with the number of distinct
+cities, not with the number of open connections.
+"""
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, cities, max_queue):
+        self.cities = cities
+        self.events = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+
+class LiveHub:
+    """Fan out per-city current-condition changes to subscribers"""
+
+    def __init__(self, fetch, interval=60, max_queue=100):
+        """fetch(city) returns the current record for a city, or None on failure"""
+        self.fetch = fetch
+        self.interval = interval
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = {}   # city -> set of Subscription
+        self._snapshots = {}     # city -> last record sent
+        self._pollers = {}       # city -> threading.Event that stops its poller
+
+    def subscribe(self, cities):
+        """Register a subscription; cities already polled get their snapshot queued at once"""
+        subscription = Subscription(cities, self.max_queue)
+        with self._lock:
+            for city in cities:
+                self._subscribers.setdefault(city, set()).add(subscription)
+                snapshot = self._snapshots.get(city)
+                if snapshot is not None:
+                    subscription.events.put_nowait(('snapshot', {'city': city, 'data': snapshot}))
+                if city not in self._pollers:
+                    stop = threading.Event()
+                    self._pollers[city] = stop
+                    threading.Thread(target=self._poll, args=(city, stop), name=f"live-{city}", daemon=True).start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            for city in subscription.cities:
+                subscribers = self._subscribers.get(city)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    # Last subscriber gone: stop polling this city
+                    del self._subscribers[city]
+                    self._snapshots.pop(city, None)
+                    self._pollers.pop(city).set()
+
+    def _poll(self, city, stop):
+        while not stop.is_set():
+            try:
+                record = self.fetch(city)
+            except Exception as e:
+                logger.warning("Live poll for %s failed: %s", city, e)
+                record = None
+            if record is not None and not stop.is_set():
+                self._publish(city, record)
+            stop.wait(self.interval)
+
+    def _publish(self, city, record):
+        with self._lock:
+            previous = self._snapshots.get(city) or {}
+            changes = {key: value for key, value in record.items() if previous.get(key) != value}
+            if not changes:
+                return
+            self._snapshots[city] = record
+            subscribers = list(self._subscribers.get(city, ()))
+        event = ('snapshot', {'city': city, 'data': record}) if not previous else \
+            ('update', {'city': city, 'changes': changes})
+        for subscription in subscribers:
+            try:
+                subscription.events.put_nowait(event)
+            except queue.Full:
+                # A consumer this far behind can no longer apply diffs; drop it so it reconnects
+                logger.warning("Dropping slow live subscriber for %s", ', '.join(subscription.cities))
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            subscriptions = {id(s) for subscribers in self._subscribers.values() for s in subscribers}
+            return {'cities': len(self._pollers), 'subscriptions': len(subscriptions)}
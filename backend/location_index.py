@@ -0,0 +1,149 @@
+"""
+In-memory prefix index for location autocomplete
+
+Locations returned by WeatherAPI search are kept in a sorted array of
+normalized keys (the full name plus every word of "name, region, country"), so
+all locations under a prefix are one bisect and a short scan away. A query of
+several words matches the places where every word prefixes one of their keys.
+A query is answered locally when the index already holds a full page of
+matches for it, or when it is covered: an earlier upstream search for one of
+its prefixes returned fewer results than the limit. Upstream does not match
+on name prefixes alone, so coverage only settles single-word queries and
+multi-word queries that match something; anything else goes upstream.
+"""
+import re
+import threading
+from bisect import bisect_left
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def normalize(text):
+    """Lowercased, whitespace-collapsed form used for keys and queries"""
+    return ' '.join(text.lower().split())
+
+
+def location_id(location):
+    """Identity of a place: name and coordinates rounded to ~10 km.
+
+    The country is left out because seeds may spell it differently from
+    WeatherAPI ('UK' vs 'United Kingdom') and must still match their upstream twin.
+    """
+    return (normalize(location['name']), round(location['lat'], 1), round(location['lon'], 1))
+
+
+class LocationIndex:
+    """Sorted-array prefix index of location dicts"""
+
+    def __init__(self, limit=10, max_entries=20000):
+        self.limit = limit
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._keys = []          # sorted (key, location_id)
+        self._locations = {}     # location_id -> location dict
+        self._seeded = set()     # location ids that survive a reset
+        self._covered = set()    # normalized queries whose upstream answer was complete
+        self.hits = 0
+        self.misses = 0
+
+    def seed(self, locations):
+        """Add locations that are always kept and ranked first"""
+        with self._lock:
+            for location in locations:
+                self._seeded.add(location_id(location))
+                self._add(location)
+
+    def learn(self, query, locations):
+        """Record an upstream answer for query and index its locations"""
+        query = normalize(query)
+        with self._lock:
+            if len(self._locations) + len(locations) > self.max_entries:
+                self._reset()
+            for location in locations:
+                self._add(location)
+            if len(locations) < self.limit:
+                self._covered.add(query)
+
+    def lookup(self, query, covered_only=True):
+        """Matches for query, or None when covered_only and the index cannot answer it"""
+        query = normalize(query)
+        with self._lock:
+            matches = self._matches(query)
+            # 'london, united' under a covered 'lond' may still be a place we never learned
+            covered = (len(_WORD.findall(query)) <= 1 or matches) and self._is_covered(query)
+            if covered_only and len(matches) < self.limit and not covered:
+                self.misses += 1
+                return None
+            if covered_only:
+                self.hits += 1
+            return [dict(self._locations[match]) for match in matches[:self.limit]]
+
+    def _add(self, location):
+        ident = location_id(location)
+        # Upstream details replace what we had, but keys already indexed stay valid
+        self._locations[ident] = location
+        for key in _keys_for(location):
+            entry = (key, ident)
+            position = bisect_left(self._keys, entry)
+            if position == len(self._keys) or self._keys[position] != entry:
+                self._keys.insert(position, entry)
+
+    def _matches(self, query):
+        words = _WORD.findall(query)
+        if len(words) <= 1:
+            matches = self._prefixed(words[0] if words else query)
+        else:
+            # Every word must prefix a key of the same place ('paris fr' -> Paris, France)
+            matches = self._prefixed(words[0])
+            for word in words[1:]:
+                found = set(self._prefixed(word))
+                matches = [ident for ident in matches if ident in found]
+        # Popular cities first, then alphabetical by name
+        matches.sort(key=lambda ident: (ident not in self._seeded, ident[0]))
+        return matches
+
+    def _prefixed(self, prefix):
+        """Ids of locations with a key starting with prefix, in key order"""
+        matches = []
+        seen = set()
+        position = bisect_left(self._keys, (prefix,))
+        while position < len(self._keys):
+            key, ident = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            if ident not in seen:
+                seen.add(ident)
+                matches.append(ident)
+            position += 1
+        return matches
+
+    def _is_covered(self, query):
+        return any(query[:length] in self._covered for length in range(1, len(query) + 1))
+
+    def _reset(self):
+        """Forget learned locations and coverage, keeping the seeds"""
+        seeds = [self._locations[ident] for ident in self._seeded]
+        self._keys = []
+        self._locations = {}
+        self._covered = set()
+        for location in seeds:
+            self._add(location)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': 'search_index',
+                'entries': len(self._locations),
+                'covered_prefixes': len(self._covered),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def _keys_for(location):
+    keys = {normalize(location['name'])}
+    display = normalize(f"{location['name']} {location.get('region', '')} {location['country']}")
+    keys.update(_WORD.findall(display))
+    return keys
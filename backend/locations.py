@@ -0,0 +1,127 @@
+"""
+Canonical location resolution
+
+`london`, `London, UK` and `51.52,-0.11` all name the same place. Every
+WeatherAPI response carries a location block; the resolver remembers which
+query produced which block, so later requests for any alias key caches,
+stored history and trackers on one canonical id (name, region and country as
+WeatherAPI spells them) and query upstream with one canonical query (the
+location's own coordinates). Search results teach their "name, region,
+country" and coordinate forms the same way. Queries never seen before are
+keyed on their normalized text until their first fetch resolves them.
+
+With a store (the persistent history store), learned aliases are written
+through to it and memo misses are looked up there, so keys survive restarts
+and agree across workers.
+
+Resolved locations are also kept in a grid index, so a coordinate query that
+is no known alias can be matched to known places within a few hundred metres.
+"""
+import logging
+import re
+
+from cache import TTLCache
+from geo_index import GeoIndex
+from location_index import normalize
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+_COMMA = re.compile(r"\s*,\s*")
+
+logger = logging.getLogger(__name__)
+
+
+def alias_key(query):
+    """Normalized form of a query; coordinates are rounded to about 10 m"""
+    match = _COORDINATES.match(query)
+    if match:
+        return f"{round(float(match.group(1)), 4):g},{round(float(match.group(2)), 4):g}"
+    return normalize(_COMMA.sub(', ', query))
+
+
+def canonical_id(location):
+    """Id of a WeatherAPI location block or search result"""
+    return '|'.join(normalize(location.get(field) or '') for field in ('name', 'region', 'country'))
+
+
+class LocationResolver:
+    """Memoized alias -> canonical location mapping"""
+
+    def __init__(self, max_entries=50000, grid_cell_km=1.0, store=None):
+        self.store = store
+        self._aliases = TTLCache("location_aliases", max_entries=max_entries)
+        self._queries = TTLCache("location_queries", max_entries=max_entries)  # id -> upstream query
+        self._grid = GeoIndex(cell_km=grid_cell_km, max_entries=max_entries)
+
+    def resolve(self, query):
+        """Canonical id for query, or None until a response has resolved it"""
+        key = alias_key(query)
+        ident = self._aliases.get(key)
+        if ident is None and self.store is not None:
+            try:
+                stored = self.store.get_alias(key)
+            except Exception as e:
+                logger.error("Error reading location alias: %s", e)
+                stored = None
+            if stored is not None:
+                ident, upstream = stored
+                self._aliases.set(key, ident)
+                if self._queries.get(ident) is None:
+                    self._queries.set(ident, upstream)
+        return ident
+
+    def key(self, query):
+        """Cache/store key for query: its canonical id when known, else its normalized text"""
+        return self.resolve(query) or alias_key(query)
+
+    def upstream_query(self, query):
+        """What to send WeatherAPI as q, so every alias of a place makes the identical request"""
+        ident = self.resolve(query)
+        return (ident and self._queries.get(ident)) or query
+
+    def nearby(self, query, radius_km):
+        """[(distance_km, canonical id)] of known places within radius_km of a "lat,lon" query, nearest first"""
+        match = _COORDINATES.match(query)
+        if match is None or radius_km <= 0:
+            return []
+        return self._grid.nearby(float(match.group(1)), float(match.group(2)), radius_km)
+
+    def learn(self, query, location):
+        """Record that query resolved to a WeatherAPI location block; returns the canonical id"""
+        return self._add(location, query)
+
+    def learn_search_results(self, locations):
+        """Index search results by their display and coordinate forms (the prefix typed is no alias)"""
+        for location in locations:
+            self._add(location)
+
+    def _add(self, location, query=None):
+        ident = canonical_id(location)
+        coordinates = f"{location['lat']},{location['lon']}"
+        upstream = self._queries.get(ident)
+        if upstream is None:
+            upstream = coordinates
+            self._queries.set(ident, upstream)
+        keys = {alias_key(_display_name(location)), alias_key(coordinates)}
+        if query:
+            keys.add(alias_key(query))
+        # Only aliases that are new (or moved) to this process are written through
+        changed = [key for key in keys if self._aliases.get(key) != ident]
+        for key in changed:
+            self._aliases.set(key, ident)
+        if changed and self.store is not None:
+            try:
+                self.store.put_aliases(changed, ident, upstream)
+            except Exception as e:
+                logger.error("Error writing location aliases: %s", e)
+        self._grid.add(ident, float(location['lat']), float(location['lon']))
+        return ident
+
+    def stats(self):
+        stats = self._aliases.stats()
+        stats['locations'] = len(self._queries)
+        stats['grid_points'] = len(self._grid)
+        return stats
+
+
+def _display_name(location):
+    return ', '.join(part for part in (location['name'], location.get('region'), location['country']) if part)
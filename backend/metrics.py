@@ -0,0 +1,154 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+Counters and histograms are labelled and thread-safe. Gauges are read from a
+callback at scrape time, which suits values other objects already track
+(cache sizes, hit counts, circuit breaker state).
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block; labels may be updated inside it"""
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    bucket_labels = labels + (('le', _format_value(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge whose samples come from fn() -> iterable of (labels dict, value)"""
+
+    def __init__(self, name, documentation, fn, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.fn():
+            lines.append(f"{self.name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        return self.register(Counter(name, documentation))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, buckets))
+
+    def gauge(self, name, documentation, fn, kind='gauge'):
+        return self.register(CallbackGauge(name, documentation, fn, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Latency of API requests by route, method and status")
+HTTP_REQUEST_ERRORS = REGISTRY.counter(
+    "http_request_errors_total", "API responses with a 5xx status by route")
+UPSTREAM_REQUEST_DURATION = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Latency of individual upstream HTTP attempts by upstream and endpoint")
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "upstream_requests_total", "Upstream HTTP attempts by upstream, endpoint and outcome")
+COHERE_REQUEST_DURATION = REGISTRY.histogram(
+    "cohere_request_duration_seconds", "Latency of Cohere generate calls by outcome")
+UPSTREAM_BUDGET_DECISIONS = REGISTRY.counter(
+    "upstream_budget_decisions_total", "Upstream admission decisions by provider, priority and outcome")
+UPSTREAM_BUDGET_WAIT = REGISTRY.histogram(
+    "upstream_budget_wait_seconds", "Time spent waiting for an upstream token by provider and priority",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+APPROXIMATE_RESPONSES = REGISTRY.counter(
+    "approximate_responses_total", "Coordinate queries answered from a nearby place's cached data by kind")
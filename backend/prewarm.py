@@ -0,0 +1,89 @@
+"""
+Background pre-warming of popular cities
+
+A daemon thread walks a fixed list of (city, task) jobs and spaces them evenly
+across each refresh interval, so upstream calls are spread out instead of
+bursting at the start of every cycle. The outcome of every job is recorded so
+the freshness of each warmed entry can be inspected.
+"""
+import datetime
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PrewarmScheduler:
+    """Run refresh tasks for hot cities on a fixed cadence"""
+
+    def __init__(self, cities, tasks, interval=300):
+        """cities: city names; tasks: {name: fn(city)}; interval: seconds per full cycle"""
+        self.cities = list(cities)
+        self.tasks = dict(tasks)
+        self.interval = interval
+        self.jobs = [(city, name) for city in self.cities for name in self.tasks]
+        self._status = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not self.jobs:
+            return
+        self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+        self._thread.start()
+        logger.info("Pre-warming %d cities (%s) every %ss", len(self.cities), ', '.join(self.tasks), self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        slot = self.interval / len(self.jobs)
+        while not self._stop.is_set():
+            for city, name in self.jobs:
+                started = time.monotonic()
+                self.run_job(city, name)
+                # Wait out the rest of this job's slot before starting the next one
+                if self._stop.wait(max(0.0, slot - (time.monotonic() - started))):
+                    return
+
+    def run_job(self, city, name):
+        started = time.monotonic()
+        error = None
+        try:
+            self.tasks[name](city)
+        except Exception as e:
+            error = str(e)
+            logger.warning("Pre-warm %s for %s failed: %s", name, city, e)
+        now = time.time()
+        with self._lock:
+            entry = self._status.setdefault((city, name), {'last_success': None})
+            entry['last_attempt'] = now
+            entry['duration_seconds'] = round(time.monotonic() - started, 3)
+            entry['last_error'] = error
+            if error is None:
+                entry['last_success'] = now
+
+    def status(self):
+        """Freshness of every warmed entry: {city: {task: {...}}}"""
+        now = time.time()
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._status.items()]
+        status = {city: {} for city in self.cities}
+        for (city, name), entry in items:
+            last_success = entry['last_success']
+            status[city][name] = {
+                'last_refreshed': _iso(last_success),
+                'age_seconds': round(now - last_success, 1) if last_success else None,
+                'last_attempt': _iso(entry['last_attempt']),
+                'duration_seconds': entry['duration_seconds'],
+                'last_error': entry['last_error'],
+            }
+        return status
+
+
+def _iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec='seconds')
@@ -0,0 +1,169 @@
+"""
+Quota-aware admission for upstream calls
+
+Every WeatherAPI and Cohere call takes a token from its provider's bucket
+first. Calls carry a priority class, read from a context variable so it
+follows the work into thread pools: interactive requests may drain the bucket
+and are served before anyone else waiting; batch and prefetch work leaves a
+reserve for them; backfill only runs while the bucket is at least half full
+and never waits. When a class cannot get a token within its wait budget, or
+the monthly quota share of its class is used up, the call is shed with
+QuotaExceededError instead of being sent.
+"""
+import contextvars
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from deadline import clamp_timeout
+from metrics import UPSTREAM_BUDGET_DECISIONS, UPSTREAM_BUDGET_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class PriorityClass:
+    def __init__(self, level, reserve, max_wait, quota_share):
+        self.level = level              # lower is served first
+        self.reserve = reserve          # fraction of the burst that must stay in the bucket
+        self.max_wait = max_wait        # seconds to wait for a token before shedding
+        self.quota_share = quota_share  # fraction of the monthly quota this class may use
+
+
+PRIORITIES = {
+    'interactive': PriorityClass(0, reserve=0.0, max_wait=2.0, quota_share=1.0),
+    'batch': PriorityClass(1, reserve=0.25, max_wait=5.0, quota_share=0.97),
+    'prefetch': PriorityClass(1, reserve=0.25, max_wait=10.0, quota_share=0.95),
+    'backfill': PriorityClass(2, reserve=0.5, max_wait=0.0, quota_share=0.9),
+}
+
+_priority = contextvars.ContextVar('upstream_priority', default='interactive')
+
+
+class QuotaExceededError(Exception):
+    """An upstream call was shed by admission control"""
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def request_priority(name):
+    """Run the block at priority `name`, or at the current one if that is already lower"""
+    current = _priority.get()
+    if PRIORITIES[current].level > PRIORITIES[name].level:
+        name = current
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def prioritized(name, fn):
+    """fn wrapped so every call runs at priority `name` (for background threads)"""
+    def run(*args, **kwargs):
+        with request_priority(name):
+            return fn(*args, **kwargs)
+    return run
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """Thread pool whose tasks run with the submitter's context variables (and so its priority)"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class QuotaScheduler:
+    """Token bucket plus monthly quota for one provider"""
+
+    def __init__(self, name, rate, burst, monthly_quota=0):
+        """rate: tokens per second (<= 0 disables rate limiting); monthly_quota: 0 for none"""
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.monthly_quota = monthly_quota
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = {}  # level -> callers currently waiting
+        self._month = _month()
+        self.month_used = 0
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.shed = {priority: 0 for priority in PRIORITIES}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=None):
+        """Take one token for a call at `priority` (default: the current context's), or raise QuotaExceededError"""
+        priority = priority or current_priority()
+        cls = PRIORITIES[priority]
+        started = time.monotonic()
+        max_wait = clamp_timeout(cls.max_wait)
+        with self._cond:
+            if self._month != _month():
+                self._month, self.month_used = _month(), 0
+            if self.monthly_quota and self.month_used >= self.monthly_quota * cls.quota_share:
+                self._reject(priority, 'shed_quota', f"{self.name} monthly quota reserved for higher priorities")
+            if self.rate <= 0:
+                self._admit(priority, started)
+                return
+
+            floor = 1 + cls.reserve * (self.burst - 1)
+            self._waiting[cls.level] = self._waiting.get(cls.level, 0) + 1
+            try:
+                while True:
+                    self._refill()
+                    ahead = any(count for level, count in self._waiting.items() if level < cls.level)
+                    if not ahead and self.tokens >= floor:
+                        self.tokens -= 1
+                        self._admit(priority, started)
+                        return
+                    remaining = started + max_wait - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(priority, 'shed_rate', f"{self.name} rate budget exhausted for {priority} work")
+                    self._cond.wait(min(remaining, max((floor - self.tokens) / self.rate, 0.005)))
+            finally:
+                self._waiting[cls.level] -= 1
+                # Let lower priorities re-check now that this caller is gone
+                self._cond.notify_all()
+
+    def _admit(self, priority, started):
+        self.month_used += 1
+        self.admitted[priority] += 1
+        UPSTREAM_BUDGET_DECISIONS.inc(provider=self.name, priority=priority, outcome='admitted')
+        UPSTREAM_BUDGET_WAIT.observe(time.monotonic() - started, provider=self.name, priority=priority)
+
+    def _reject(self, priority, outcome, message):
+        self.shed[priority] += 1
+        UPSTREAM_BUDGET_DECISIONS.inc(provider=self.name, priority=priority, outcome=outcome)
+        logger.warning("Shedding upstream call: %s", message)
+        raise QuotaExceededError(message)
+
+    def stats(self):
+        with self._cond:
+            if self.rate > 0:
+                self._refill()
+            return {
+                'name': self.name,
+                'rate_per_second': self.rate,
+                'burst': self.burst,
+                'tokens': round(self.tokens, 2),
+                'month': self._month,
+                'month_used': self.month_used,
+                'monthly_quota': self.monthly_quota or None,
+                'waiting': sum(self._waiting.values()),
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed),
+            }
+
+
+def _month():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m')
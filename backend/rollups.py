@@ -0,0 +1,85 @@
+"""
+Weekly and monthly rollups of daily history records
+
+A rollup aggregates the daily records of one calendar period (ISO week
+starting Monday, or calendar month) into a single point with the same field
+names as a daily record where that makes sense, plus *_max companions:
+temperature/humidity/AQI/pollutants are means, min_temp/max_temp are the
+extremes and rainfall is the total. The same function is used for rollups
+kept in the history store and for partial periods computed on the fly.
+"""
+import calendar
+import datetime
+from datetime import timedelta
+
+RESOLUTIONS = ('day', 'week', 'month')
+POLLUTANTS = ('PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'O3')
+
+# (output field, aggregate, daily field)
+AGGREGATES = [
+    ('temperature', 'mean', 'temperature'),
+    ('min_temp', 'min', 'min_temp'),
+    ('max_temp', 'max', 'max_temp'),
+    ('rainfall', 'sum', 'rainfall'),
+    ('humidity', 'mean', 'humidity'),
+    ('AQI', 'mean', 'AQI'),
+    ('AQI_max', 'max', 'AQI'),
+    *[(field, 'mean', field) for field in POLLUTANTS],
+    *[(f'{field}_max', 'max', field) for field in POLLUTANTS],
+]
+LOCATION_FIELDS = ('city', 'country', 'latitude', 'longitude')
+
+_AGGREGATORS = {
+    'mean': lambda values: sum(values) / len(values),
+    'min': min,
+    'max': max,
+    'sum': sum,
+}
+
+
+def period_start(date, resolution):
+    """First day ('YYYY-MM-DD') of the week or month containing date"""
+    day = datetime.date.fromisoformat(date)
+    if resolution == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return day.replace(day=1).isoformat()
+
+
+def period_end(period, resolution):
+    """Last day ('YYYY-MM-DD') of the period starting at period"""
+    start = datetime.date.fromisoformat(period)
+    if resolution == 'week':
+        return (start + timedelta(days=6)).isoformat()
+    return start.replace(day=calendar.monthrange(start.year, start.month)[1]).isoformat()
+
+
+def period_length(period, resolution):
+    start = datetime.date.fromisoformat(period)
+    return 7 if resolution == 'week' else calendar.monthrange(start.year, start.month)[1]
+
+
+def group_by_period(dates, resolution):
+    """{period start: [dates]} for the given dates"""
+    groups = {}
+    for date in dates:
+        groups.setdefault(period_start(date, resolution), []).append(date)
+    return groups
+
+
+def aggregate(records, resolution, period):
+    """One rollup point for the daily records of a period"""
+    rollup = {'date': period, 'resolution': resolution, 'days': len(records)}
+    for field in LOCATION_FIELDS:
+        rollup[field] = next((record[field] for record in records if record.get(field) is not None), None)
+    for output, how, source in AGGREGATES:
+        values = [float(record[source]) for record in records if isinstance(record.get(source), (int, float))]
+        rollup[output] = round(_AGGREGATORS[how](values), 2) if values else None
+    return rollup
+
+
+def rollup_records(records, resolution):
+    """Aggregate daily records into one point per period they fall in"""
+    by_period = {}
+    for record in records:
+        by_period.setdefault(period_start(record['date'], resolution), []).append(record)
+    return [aggregate(period_records, resolution, period) for period, period_records in by_period.items()]
@@ -0,0 +1,59 @@
+"""
+Incremental response helpers: newline-delimited JSON and Server-Sent Events
+
+Routes that opt in yield (event, payload) frames as soon as each piece of data
+is ready instead of building the whole JSON array first.
+"""
+from flask import Response
+
+from json_provider import dumps
+
+STREAM_MODES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+def requested_stream_mode(request):
+    """Streaming mode asked for via ?stream=ndjson|sse or the Accept header, else None"""
+    mode = request.args.get('stream', '').lower()
+    if mode in STREAM_MODES:
+        return mode
+    accept = request.headers.get('Accept', '')
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+
+def encode_frame(event, payload, mode):
+    """One frame: an NDJSON line {"type": event, ...} or an SSE event block"""
+    if mode == 'sse':
+        return f"event: {event}\ndata: {dumps(payload)}\n\n"
+    return dumps({'type': event, **payload}) + "\n"
+
+
+def stream_response(frames, mode):
+    """Response that writes each (event, payload) frame as soon as the generator yields it
+
+    A None frame is a heartbeat: an SSE comment line, skipped for NDJSON. Writing
+    it is also how a dropped client gets noticed on long-lived streams.
+    """
+    def generate():
+        if mode == 'sse':
+            # Ask the client to retry after 3s if the connection drops
+            yield "retry: 3000\n\n"
+        for frame in frames:
+            if frame is None:
+                if mode == 'sse':
+                    yield ": keep-alive\n\n"
+                continue
+            event, payload = frame
+            yield encode_frame(event, payload, mode)
+
+    response = Response(generate(), mimetype=STREAM_MODES[mode])
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so frames reach the client immediately
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
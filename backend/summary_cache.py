@@ -0,0 +1,78 @@
+"""
+Cache for generated weather summaries with stale-while-revalidate refresh
+
+A summary younger than fresh_ttl is served as is. An older one (up to
+max_stale) is still served immediately while a background thread regenerates
+it. Concurrent generations for the same key are coalesced into one call.
+"""
+import logging
+import threading
+import time
+
+from cache import TTLCache
+from quota import request_priority
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryCache:
+    """Summaries keyed on bucketed weather inputs"""
+
+    def __init__(self, fresh_ttl=1800, max_stale=21600, max_entries=1024):
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self._cache = TTLCache("summary", max_entries=max_entries, default_ttl=max_stale)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.stale_served = 0
+
+    def get(self, key, generate, timeout=None):
+        """Return the summary for key, calling generate() when none is usable.
+
+        generate() returns the summary text, or None when generation failed;
+        failures are not cached. A caller joining a generation already in flight
+        waits at most timeout seconds and then gets None.
+        """
+        entry = self._cache.get(key)
+        if entry is not None:
+            summary, generated_at = entry
+            if time.monotonic() - generated_at >= self.fresh_ttl:
+                self.stale_served += 1
+                self._refresh_in_background(key, generate)
+            return summary
+        try:
+            return self._flight.do(key, lambda: self._generate(key, generate), timeout=timeout)
+        except TimeoutError:
+            return None
+
+    def _generate(self, key, generate):
+        summary = generate()
+        if summary is not None:
+            self._cache.set(key, (summary, time.monotonic()))
+        return summary
+
+    def _refresh_in_background(self, key, generate):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                # Nobody is waiting on a refresh; keep it behind interactive generations
+                with request_priority('prefetch'):
+                    self._flight.do(key, lambda: self._generate(key, generate))
+            except Exception as e:
+                logger.error("Background summary refresh failed for %s: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats.update(stale_served=self.stale_served, generations=self._flight.executed)
+        return stats
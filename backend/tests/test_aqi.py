@@ -0,0 +1,174 @@
+"""
+The table-driven AQI engine must score exactly like the original if/elif
+chains (kept below as the reference), for scalars and for batches.
+"""
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aqi  # noqa: E402
+
+
+def legacy_pm25(pm25):
+    if pm25 <= 12.0:
+        return int(((50 - 0) / (12.0 - 0)) * (pm25 - 0) + 0)
+    elif pm25 <= 35.4:
+        return int(((100 - 51) / (35.4 - 12.1)) * (pm25 - 12.1) + 51)
+    elif pm25 <= 55.4:
+        return int(((150 - 101) / (55.4 - 35.5)) * (pm25 - 35.5) + 101)
+    elif pm25 <= 150.4:
+        return int(((200 - 151) / (150.4 - 55.5)) * (pm25 - 55.5) + 151)
+    elif pm25 <= 250.4:
+        return int(((300 - 201) / (250.4 - 150.5)) * (pm25 - 150.5) + 201)
+    elif pm25 <= 350.4:
+        return int(((400 - 301) / (350.4 - 250.5)) * (pm25 - 250.5) + 301)
+    else:
+        return int(((500 - 401) / (500.4 - 350.5)) * (pm25 - 350.5) + 401)
+
+
+def legacy_pm10(pm10):
+    if pm10 <= 54:
+        return int(((50 - 0) / (54 - 0)) * (pm10 - 0) + 0)
+    elif pm10 <= 154:
+        return int(((100 - 51) / (154 - 55)) * (pm10 - 55) + 51)
+    elif pm10 <= 254:
+        return int(((150 - 101) / (254 - 155)) * (pm10 - 155) + 101)
+    elif pm10 <= 354:
+        return int(((200 - 151) / (354 - 255)) * (pm10 - 255) + 151)
+    elif pm10 <= 424:
+        return int(((300 - 201) / (424 - 355)) * (pm10 - 355) + 201)
+    else:
+        return int(((500 - 301) / (604 - 425)) * (pm10 - 425) + 301)
+
+
+def legacy_no2(no2):
+    if no2 <= 53:
+        return int(((50 - 0) / (53 - 0)) * (no2 - 0) + 0)
+    elif no2 <= 100:
+        return int(((100 - 51) / (100 - 54)) * (no2 - 54) + 51)
+    elif no2 <= 360:
+        return int(((150 - 101) / (360 - 101)) * (no2 - 101) + 101)
+    elif no2 <= 649:
+        return int(((200 - 151) / (649 - 361)) * (no2 - 361) + 151)
+    elif no2 <= 1249:
+        return int(((300 - 201) / (1249 - 650)) * (no2 - 650) + 201)
+    else:
+        return int(((500 - 301) / (2049 - 1250)) * (no2 - 1250) + 301)
+
+
+def legacy_so2(so2):
+    if so2 <= 35:
+        return int(((50 - 0) / (35 - 0)) * (so2 - 0) + 0)
+    elif so2 <= 75:
+        return int(((100 - 51) / (75 - 36)) * (so2 - 36) + 51)
+    elif so2 <= 185:
+        return int(((150 - 101) / (185 - 76)) * (so2 - 76) + 101)
+    elif so2 <= 304:
+        return int(((200 - 151) / (304 - 186)) * (so2 - 186) + 151)
+    elif so2 <= 604:
+        return int(((300 - 201) / (604 - 305)) * (so2 - 305) + 201)
+    else:
+        return int(((500 - 301) / (1004 - 605)) * (so2 - 605) + 301)
+
+
+def legacy_co(co):
+    if co <= 4.4:
+        return int(((50 - 0) / (4.4 - 0)) * (co - 0) + 0)
+    elif co <= 9.4:
+        return int(((100 - 51) / (9.4 - 4.5)) * (co - 4.5) + 51)
+    elif co <= 12.4:
+        return int(((150 - 101) / (12.4 - 9.5)) * (co - 9.5) + 101)
+    elif co <= 15.4:
+        return int(((200 - 151) / (15.4 - 12.5)) * (co - 12.5) + 151)
+    elif co <= 30.4:
+        return int(((300 - 201) / (30.4 - 15.5)) * (co - 15.5) + 201)
+    else:
+        return int(((500 - 301) / (50.4 - 30.5)) * (co - 30.5) + 301)
+
+
+def legacy_o3(o3):
+    if o3 <= 54:
+        return int(((50 - 0) / (54 - 0)) * (o3 - 0) + 0)
+    elif o3 <= 70:
+        return int(((100 - 51) / (70 - 55)) * (o3 - 55) + 51)
+    elif o3 <= 85:
+        return int(((150 - 101) / (85 - 71)) * (o3 - 71) + 101)
+    elif o3 <= 105:
+        return int(((200 - 151) / (105 - 86)) * (o3 - 86) + 151)
+    elif o3 <= 200:
+        return int(((300 - 201) / (200 - 106)) * (o3 - 106) + 201)
+    else:
+        return max(301, min(500, int(((500 - 301) / (300 - 201)) * (o3 - 201) + 301)))
+
+
+# Reference function and µg/m³ -> EPA unit factor per pollutant, as in the original app
+LEGACY = {
+    'pm2_5': (legacy_pm25, 1.0),
+    'pm10': (legacy_pm10, 1.0),
+    'no2': (legacy_no2, 0.532),
+    'so2': (legacy_so2, 0.382),
+    'co': (legacy_co, 0.000873),
+    'o3': (legacy_o3, 0.510),
+}
+# Upper ends of the random readings (µg/m³), past every table's last breakpoint
+MAX_READING = {'pm2_5': 600, 'pm10': 800, 'no2': 4500, 'so2': 3000, 'co': 70000, 'o3': 700}
+
+
+def random_readings(rng, pollutant, count):
+    """Uniform readings plus values on and around every breakpoint"""
+    values = [round(rng.uniform(0, MAX_READING[pollutant]), rng.choice((0, 1, 2, 3))) for _ in range(count)]
+    factor = LEGACY[pollutant][1]
+    for low, high, _, _ in aqi.BREAKPOINTS[pollutant].segments:
+        for edge in (low, high):
+            values.extend(edge / factor + offset for offset in (-0.01, 0.0, 0.01))
+    return values
+
+
+def legacy_comprehensive(block):
+    """Original calculate_comprehensive_aqi without the city-based estimate (-1 when nothing is available)"""
+    scores = [LEGACY[pollutant][0](block[pollutant] * LEGACY[pollutant][1])
+              for pollutant in LEGACY if block.get(pollutant, 0) > 0]
+    return max(scores) if scores else -1
+
+
+def test_scalar_matches_legacy():
+    rng = random.Random(7)
+    for pollutant, (legacy, factor) in LEGACY.items():
+        for value in random_readings(rng, pollutant, 20000):
+            expected = legacy(value * factor) if value > 0 else None
+            if expected is not None:
+                assert aqi.sub_index(pollutant, aqi.to_epa_units(pollutant, value)) == expected, (pollutant, value)
+
+
+def test_batch_matches_legacy():
+    rng = random.Random(11)
+    readings = {pollutant: random_readings(rng, pollutant, 20000) for pollutant in LEGACY}
+    size = min(len(values) for values in readings.values())
+    readings = {pollutant: values[:size] for pollutant, values in readings.items()}
+    # Some absent and non-positive readings
+    for values in readings.values():
+        for index in rng.sample(range(size), size // 10):
+            values[index] = rng.choice((0, -1.0))
+
+    results = aqi.calculate_aqi_batch(readings)
+    for pollutant, (legacy, factor) in LEGACY.items():
+        expected = [legacy(value * factor) if value > 0 else -1 for value in readings[pollutant]]
+        assert results[pollutant].tolist() == expected, pollutant
+    expected_overall = np.max([results[pollutant] for pollutant in LEGACY], axis=0)
+    assert results['aqi'].tolist() == expected_overall.tolist()
+
+
+def test_blocks_match_legacy_comprehensive():
+    rng = random.Random(13)
+    blocks = []
+    for _ in range(5000):
+        block = {pollutant: round(rng.uniform(0, MAX_READING[pollutant]), 1)
+                 for pollutant in LEGACY if rng.random() < 0.8}
+        blocks.append(block)
+    blocks.append({})
+    scores = aqi.calculate_aqi_for_blocks(blocks)
+    assert scores.tolist() == [legacy_comprehensive(block) for block in blocks]
@@ -0,0 +1,221 @@
+"""
+Shared HTTP client for upstream APIs (WeatherAPI)
+
+One pooled requests.Session per upstream keeps TCP/TLS connections alive across
+calls. Every request gets connect/read timeouts, 5xx and 429 responses are
+retried with jittered exponential backoff, and a circuit breaker fails fast
+while the upstream keeps failing. Identical requests of the same priority class
+already in flight are coalesced into one upstream call. Timeouts, retries
+and waits never run past the current request's deadline.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import DeadlineExceeded, check_deadline, clamp_timeout, expired, remaining
+from metrics import UPSTREAM_REQUEST_DURATION, UPSTREAM_REQUESTS
+from quota import current_priority
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """Upstream request failed after all retries"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Upstream is considered degraded; the request was not attempted"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed: requests flow normally. After failure_threshold consecutive failures
+    the breaker opens and rejects requests for reset_timeout seconds, then lets
+    a single trial request through (half-open). Its outcome closes or re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_thread = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_thread = threading.get_ident()
+                return True
+            # Open, or half-open with the trial request still in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release(self):
+        """End this thread's half-open trial if it finished without recording an outcome.
+
+        The trial slot is the only way out of half-open, so a trial that was
+        shed or abandoned re-opens the breaker rather than leaving it stuck.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._trial_thread == threading.get_ident():
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit opened after %d consecutive failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """Pooled, retrying JSON client for one upstream API"""
+
+    def __init__(self, name, base_url, default_params=None, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_base=0.25, backoff_max=4.0, pool_size=32, breaker=None,
+                 coalesce=True, scheduler=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.default_params = default_params or {}
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.single_flight = SingleFlight() if coalesce else None
+        # Optional quota.QuotaScheduler; every attempt, retries included, spends a token
+        self.scheduler = scheduler
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than a Retry-After hint"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def get_json(self, path, params=None):
+        """GET base_url/path and return the decoded JSON body.
+
+        Concurrent calls with the same path, params and priority class share one
+        request and receive the same (shared, read-only) body. Raises CircuitOpenError without calling upstream while the breaker is open,
+        QuotaExceededError when the scheduler sheds the call, DeadlineExceeded when
+        the request's deadline passes first, requests.HTTPError for non-retryable
+        4xx responses, and UpstreamError once retries are exhausted.
+        """
+        # Out of time already: don't take the half-open trial slot at all
+        check_deadline(f"{self.name} {path}")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open, skipping {path}")
+        try:
+            return self._coalesced_get_json(path, params)
+        finally:
+            # A half-open trial that was shed or cut short by the deadline records no
+            # outcome (a self-inflicted timeout is no failure); hand its slot back
+            self.breaker.release()
+
+    def _coalesced_get_json(self, path, params):
+        if self.single_flight is None:
+            return self._get_json(path, params)
+        # Joining a lower class's call would wait, and be shed, at its priority
+        key = (path, tuple(sorted((params or {}).items())), current_priority())
+        led = []
+
+        def call():
+            led.append(True)
+            return self._get_json(path, params)
+
+        try:
+            return self.single_flight.do(key, call, timeout=remaining())
+        except DeadlineExceeded:
+            if led or expired():
+                raise
+            # Joined a call that ran out of another request's time; this one has some left
+            return self._get_json(path, params)
+        except TimeoutError as e:
+            raise DeadlineExceeded(f"{self.name} {path}: deadline exceeded while waiting for a shared call") from e
+
+    def _get_json(self, path, params):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        query = {**self.default_params, **(params or {})}
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            check_deadline(f"{self.name} {path}")
+            if self.scheduler is not None:
+                self.scheduler.acquire()
+            start = time.perf_counter()
+            try:
+                timeout = tuple(max(0.001, clamp_timeout(timeout)) for timeout in self.timeout)
+                response = self.session.get(url, params=query, timeout=timeout)
+            except requests.RequestException as e:
+                self._observe(path, type(e).__name__, start)
+                if expired():
+                    # Cut short by our own deadline, which says nothing about the upstream's health
+                    raise DeadlineExceeded(f"{self.name} {path}: deadline exceeded") from e
+                last_error = e
+            else:
+                self._observe(path, str(response.status_code), start)
+                if response.status_code != 429 and response.status_code < 500:
+                    # A 4xx is the caller's problem, not a sign of a degraded upstream
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response.json()
+                last_error = requests.HTTPError(f"{response.status_code} from {self.name} {path}", response=response)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt < self.max_retries:
+                delay = self.backoff(attempt, retry_after)
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise DeadlineExceeded(f"{self.name} {path}: no time left to retry after {last_error}")
+                logger.warning("%s %s attempt %d failed (%s), retrying in %.2fs",
+                               self.name, path, attempt + 1, last_error, delay)
+                time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise UpstreamError(f"{self.name} {path} failed after {self.max_retries + 1} attempts: {last_error}")
+
+    def _observe(self, path, outcome, start):
+        UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - start, upstream=self.name, endpoint=path)
+        UPSTREAM_REQUESTS.inc(upstream=self.name, endpoint=path, outcome=outcome)
+
+    def stats(self):
+        stats = {'name': self.name, 'circuit': self.breaker.state, 'consecutive_failures': self.breaker.failures}
+        if self.single_flight is not None:
+            stats.update(self.single_flight.stats())
+        return stats
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (only the delta-seconds form is used)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None